@@ -1,10 +1,70 @@
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+from Common.clients import get_client
+
+
+# DeleteAlarms accepts at most 100 alarm names per call.
+DELETE_ALARMS_LIMIT = 100
+
+# Fields of a put_metric_alarm request which describe_alarms doesn't return.
+_UNCOMPARED_FIELDS = ('Tags',)
+
+
+def _normalize_query(query):
+    """
+    Normalizes a MetricDataQuery of a metric math alarm: dimensions are sorted and
+    the default ReturnData and empty fields are dropped.
+    """
+    query = {key: value for key, value in query.items() if value not in ('', None, [])}
+    if query.get('ReturnData') is True:
+        del query['ReturnData']
+    if 'MetricStat' in query:
+        metric = dict(query['MetricStat']['Metric'])
+        metric['Dimensions'] = _normalize('Dimensions', metric.get('Dimensions', []))
+        query['MetricStat'] = dict(query['MetricStat'], Metric=metric)
+    return query
+
+
+def _normalize(field, value):
+    """
+    Normalizes an alarm field so equal settings compare equal, whatever the
+    order of the dimensions, actions or metric queries.
+    """
+    if field == 'Dimensions':
+        return sorted((d['Name'], d['Value']) for d in value)
+    if field == 'Metrics':
+        return sorted((_normalize_query(query) for query in value), key=lambda q: q['Id'])
+    if field in ('AlarmActions', 'OKActions', 'InsufficientDataActions', 'ExtendedStatistic'):
+        return sorted(value) if isinstance(value, list) else value
+    if field == 'Threshold':
+        return float(value)
+    return value
+
+
+def alarm_differs(desired, existing):
+    """
+    Tells whether an existing alarm differs from the desired put_metric_alarm
+    arguments, only the fields of the desired spec are compared.
+    """
+    for field, value in desired.items():
+        if field in _UNCOMPARED_FIELDS:
+            continue
+        if field not in existing:
+            # Empty values and an enabled ActionsEnabled are the API defaults.
+            if value in ([], '', None) or (field == 'ActionsEnabled' and value is True):
+                continue
+            return True
+        if _normalize(field, value) != _normalize(field, existing[field]):
+            return True
+    return False
 
 
 class CloudWatch(object):
-    def __init__(self, client) -> None:
-        self.client = client
+    def __init__(self, client=None) -> None:
+        """
+        :param client: The Boto3 CloudWatch client, defaults to the shared one.
+        """
+        self.client = client or get_client('cloudwatch')
 
     def create_alarm(
         self, name: str, description: str, dimensions: list,
@@ -54,9 +114,98 @@ class CloudWatch(object):
             if not isinstance(alarm_names, list):
                 print("Bad parameter: alarm_names parameter is of type list.")
                 raise
-            response = self.client.delete_alarms(
-                AlarmNames=alarm_names
-            )
+            response = None
+            for start in range(0, len(alarm_names), DELETE_ALARMS_LIMIT):
+                response = self.client.delete_alarms(
+                    AlarmNames=alarm_names[start:start + DELETE_ALARMS_LIMIT]
+                )
             return response
         except ClientError as e:
             print(e)
+
+    def describe_metric_alarms(self, prefix=None):
+        """
+        Returns every metric alarm, paging through describe_alarms.
+
+        :param prefix: Only return the alarms whose name starts with the prefix.
+        :return: A dict of the alarms by name.
+        """
+        kwargs = {'AlarmTypes': ['MetricAlarm']}
+        if prefix:
+            kwargs['AlarmNamePrefix'] = prefix
+        alarms = {}
+        for page in self.client.get_paginator('describe_alarms').paginate(**kwargs):
+            for alarm in page['MetricAlarms']:
+                alarms[alarm['AlarmName']] = alarm
+        return alarms
+
+    def sync_alarms(self, desired_specs, prefix=None, prune=False, dry_run=False, workers=8):
+        """
+        Brings the metric alarms to the desired state. The existing alarms are read
+        once and only the missing or changed alarms are put.
+
+        Example desired_specs: [
+            {
+            'AlarmName': 'cpu-<INSTANCE_ID>',
+            'MetricName': 'CPUUtilization',
+            'Namespace': 'AWS/EC2',
+            'Statistic': 'Average',
+            'Period': 300,
+            'EvaluationPeriods': 1,
+            'Threshold': 70.0,
+            'ComparisonOperator': 'GreaterThanOrEqualToThreshold',
+            'Dimensions': [{'Name': 'InstanceId', 'Value': '<INSTANCE_ID>'}]
+            },
+        ]
+
+        :param desired_specs: A list of put_metric_alarm arguments, one per alarm.
+        :param prefix: Only alarms whose name starts with the prefix are managed,
+                       every desired alarm name must start with it.
+        :param prune: Delete the managed alarms which are not desired. Without a
+                      prefix every metric alarm of the account is managed.
+        :param dry_run: Only compute the plan, don't change anything.
+        :param workers: Number of concurrent put_metric_alarm calls.
+        :return: The plan with the names to 'create', 'update', 'delete', the
+                 'unchanged' ones and the 'errors' by alarm name.
+        """
+        desired = {spec['AlarmName']: spec for spec in desired_specs}
+        if prefix:
+            # They would not be read back, and so be put again on every run.
+            outside = sorted(name for name in desired if not name.startswith(prefix))
+            if outside:
+                raise ValueError(f'Alarm names outside the prefix {prefix!r}: {outside}')
+        existing = self.describe_metric_alarms(prefix)
+        plan = {'create': [], 'update': [], 'unchanged': [], 'delete': [], 'errors': {}}
+        for name, spec in desired.items():
+            if name not in existing:
+                plan['create'].append(name)
+            elif alarm_differs(spec, existing[name]):
+                plan['update'].append(name)
+            else:
+                plan['unchanged'].append(name)
+        if prune:
+            plan['delete'] = sorted(set(existing) - set(desired))
+
+        print(f"Alarm sync plan: {len(plan['create'])} to create, "
+              f"{len(plan['update'])} to update, {len(plan['delete'])} to delete, "
+              f"{len(plan['unchanged'])} unchanged{' (dry run)' if dry_run else ''}")
+        if dry_run:
+            return plan
+
+        def put_alarm(name):
+            try:
+                self.client.put_metric_alarm(**desired[name])
+            except ClientError as e:
+                plan['errors'][name] = str(e)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(put_alarm, plan['create'] + plan['update']))
+
+        for start in range(0, len(plan['delete']), DELETE_ALARMS_LIMIT):
+            chunk = plan['delete'][start:start + DELETE_ALARMS_LIMIT]
+            try:
+                self.client.delete_alarms(AlarmNames=chunk)
+            except ClientError as e:
+                for name in chunk:
+                    plan['errors'][name] = str(e)
+        return plan
@@ -1,43 +1,321 @@
-# Outputs all loggroups with > 1GB of incomingBytes in the past 7 days
+# Reports the log groups with more than a threshold of IncomingBytes over a
+# time window, by default > 1GB in the past 7 days, and fetches/tails the log
+# events of many streams concurrently.
 
-import boto3
+import argparse
+import csv
+import heapq
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 from datetime import timedelta
+from Common.clients import get_client
+from Common.retry import THROTTLING_CODES, Retrier
 
 
-logs_client = boto3.client('logs')
-cloudwatch_client = boto3.client('cloudwatch')
+# GetMetricData accepts at most 500 metric queries per call.
+METRIC_QUERIES_LIMIT = 500
+# FilterLogEvents accepts at most 100 log stream names per call.
+LOG_STREAMS_LIMIT = 100
+BYTES_PER_GB = 1000 * 1000 * 1000
+# GetMetricData returns at most 100,800 datapoints per call.
+METRIC_DATAPOINTS_LIMIT = 100800
+# Errors of a GetMetricData call which are retried, the account wide limit on
+# concurrent calls is reported as LimitExceeded.
+METRIC_DATA_RETRIED = THROTTLING_CODES + ('LimitExceeded', 'LimitExceededException')
+# Shortest period CloudWatch still holds for data older than an age: 1 minute
+# datapoints are kept 15 days, 5 minute ones 63 days, then 1 hour ones.
+RETENTION_PERIODS = (
+    (timedelta(days=63), 3600),
+    (timedelta(days=15), 300),
+    (timedelta(0), 60),
+)
 
-end_date = dt.today().isoformat(timespec='seconds')
-start_date = (dt.today() - timedelta(days=7)).isoformat(timespec='seconds')
-print("looking from %s to %s" % (start_date, end_date))
 
-paginator = logs_client.get_paginator('describe_log_groups')
-pages = paginator.paginate()
-for page in pages:
-    for json_data in page['logGroups']:
-        log_group_name = json_data.get("logGroupName")
+def _to_millis(value):
+    """
+    Converts a datetime (or epoch milliseconds) to epoch milliseconds.
+    """
+    if isinstance(value, dt):
+        return int(value.timestamp() * 1000)
+    return int(value)
 
-        cw_response = cloudwatch_client.get_metric_statistics(
-            Namespace='AWS/Logs',
-            MetricName='IncomingBytes',
-            Dimensions=[
-                {
-                    'Name': 'LogGroupName',
-                    'Value': log_group_name
+
+def _event_order(event):
+    return event['timestamp'], event['eventId']
+
+
+def metric_period(start_date, end_date, queries=1, now=None):
+    """
+    Returns the GetMetricData period of a window: a multiple of the resolution
+    CloudWatch still keeps at the age of the start date (or the window is
+    returned empty), long enough to keep every query of the call within the
+    datapoint limit, and covering the window with a single datapoint when possible.
+
+    :param queries: Number of metric queries of the call.
+    :param now: The current time, defaults to utcnow().
+    """
+    age = (now or dt.utcnow()) - start_date
+    step = next(period for min_age, period in RETENTION_PERIODS if age > min_age or not min_age)
+    seconds = int((end_date - start_date).total_seconds())
+    wanted = max(seconds, seconds * queries // METRIC_DATAPOINTS_LIMIT, step)
+    return -(-wanted // step) * step
+
+
+def _incoming_bytes(cloudwatch_client, log_group_names, start_date, end_date, retrier=None):
+    """
+    Fetches the IncomingBytes sum of up to 500 log groups with one GetMetricData
+    query per group, following NextToken.
+
+    :param retrier: The Retrier of the throttled calls, shared by the batches.
+    :return: A list of (log group name, bytes) for the groups with datapoints.
+    """
+    retrier = retrier or Retrier(METRIC_DATA_RETRIED, name='get_metric_data')
+    period = metric_period(start_date, end_date, len(log_group_names))
+    queries = [
+        {
+            'Id': f'q{idx}',
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'AWS/Logs',
+                    'MetricName': 'IncomingBytes',
+                    'Dimensions': [
+                        {
+                            'Name': 'LogGroupName',
+                            'Value': log_group_name
+                        },
+                    ]
                 },
-            ],
-            StartTime=start_date,
-            EndTime=end_date,
-            Period=3600 * 24 * 7,
-            Statistics=[
-                'Sum'
-            ],
-            Unit='Bytes'
-        )
-        if len(cw_response.get("Datapoints")):
-            stats_data = cw_response.get("Datapoints")[0]
-            stats_sum = stats_data.get("Sum")
-            sum_GB = stats_sum / (1000 * 1000 * 1000)
-            if sum_GB > 1.0:
-                print("%s = %.2f GB" % (log_group_name, sum_GB))
+                'Period': period,
+                'Stat': 'Sum',
+                'Unit': 'Bytes'
+            },
+            'ReturnData': True
+        }
+        for idx, log_group_name in enumerate(log_group_names)
+    ]
+    totals = {}
+    kwargs = {
+        'MetricDataQueries': queries,
+        'StartTime': start_date,
+        'EndTime': end_date
+    }
+    while True:
+        response = retrier.call(cloudwatch_client.get_metric_data, **kwargs)
+        for result in response['MetricDataResults']:
+            if result['Values']:
+                idx = int(result['Id'][1:])
+                totals[idx] = totals.get(idx, 0.0) + sum(result['Values'])
+        if not response.get('NextToken'):
+            break
+        kwargs['NextToken'] = response['NextToken']
+    return [(log_group_names[idx], total) for idx, total in totals.items()]
+
+
+def log_group_ingestion_report(logs_client, cloudwatch_client, threshold_gb=1.0,
+                               days=7, end_date=None, workers=4):
+    """
+    Finds the log groups which ingested more than the threshold in the window.
+    Log groups are paginated while the metrics of the previous pages are being
+    fetched, 500 log groups per GetMetricData call.
+
+    :param logs_client: The Boto3 CloudWatch Logs client.
+    :param cloudwatch_client: The Boto3 CloudWatch client.
+    :param threshold_gb: Only report the log groups above this volume (in GB).
+    :param days: Size of the time window in days.
+    :param end_date: End of the time window, defaults to now.
+    :param workers: Number of concurrent GetMetricData calls.
+    :return: A list of (log group name, bytes) sorted by decreasing volume.
+    """
+    end_date = end_date or dt.utcnow()
+    start_date = end_date - timedelta(days=days)
+    print(f'looking from {start_date.isoformat(timespec="seconds")} to '
+          f'{end_date.isoformat(timespec="seconds")}', file=sys.stderr)
+
+    retrier = Retrier(METRIC_DATA_RETRIED, name='get_metric_data')
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        paginator = logs_client.get_paginator('describe_log_groups')
+        for page in paginator.paginate():
+            for json_data in page['logGroups']:
+                batch.append(json_data.get('logGroupName'))
+                if len(batch) == METRIC_QUERIES_LIMIT:
+                    futures.append(executor.submit(
+                        _incoming_bytes, cloudwatch_client, batch, start_date, end_date,
+                        retrier))
+                    batch = []
+        if batch:
+            futures.append(executor.submit(
+                _incoming_bytes, cloudwatch_client, batch, start_date, end_date, retrier))
+
+        threshold = threshold_gb * BYTES_PER_GB
+        report = [row for future in futures for row in future.result()
+                  if row[1] > threshold]
+    report.sort(key=lambda row: row[1], reverse=True)
+    return report
+
+
+def write_report(report, output_format='csv', stream=sys.stdout):
+    """
+    Writes the report rows to the stream as CSV or as a JSON array, one row at a time.
+    """
+    if output_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(['log_group_name', 'incoming_bytes', 'incoming_gb'])
+        for log_group_name, incoming_bytes in report:
+            writer.writerow([log_group_name, int(incoming_bytes),
+                             f'{incoming_bytes / BYTES_PER_GB:.2f}'])
+    elif output_format == 'json':
+        stream.write('[')
+        for idx, (log_group_name, incoming_bytes) in enumerate(report):
+            stream.write(',\n ' if idx else '\n ')
+            json.dump({'log_group_name': log_group_name,
+                       'incoming_bytes': int(incoming_bytes),
+                       'incoming_gb': round(incoming_bytes / BYTES_PER_GB, 2)}, stream)
+        stream.write('\n]\n')
+    else:
+        for log_group_name, incoming_bytes in report:
+            stream.write('%s = %.2f GB\n' % (log_group_name, incoming_bytes / BYTES_PER_GB))
+
+
+class LogFetcher(object):
+    """
+    Fetches the events of many log streams concurrently. The time window is split
+    in slices and the streams in groups of 100, every (slice, group) shard is
+    fetched by a thread pool following its own nextToken, and the shards are
+    merged back into one time ordered stream of events with a heap.
+    """
+
+    def __init__(self, client=None, workers=8) -> None:
+        """
+        :param client: The Boto3 CloudWatch Logs client, defaults to the shared one.
+        :param workers: Number of shards fetched concurrently.
+        """
+        self.client = client or get_client('logs')
+        self.workers = workers
+
+    def _fetch_shard(self, log_group_name, start, end, stream_names, filter_pattern):
+        kwargs = {'logGroupName': log_group_name, 'startTime': start, 'endTime': end}
+        if stream_names:
+            kwargs['logStreamNames'] = stream_names
+        if filter_pattern:
+            kwargs['filterPattern'] = filter_pattern
+        events = []
+        while True:
+            response = self.client.filter_log_events(**kwargs)
+            events.extend(response['events'])
+            if not response.get('nextToken'):
+                break
+            kwargs['nextToken'] = response['nextToken']
+        events.sort(key=_event_order)
+        return events
+
+    def fetch(self, log_group_name, start, end, stream_names=None, filter_pattern=None,
+              slices=None, prefetch=None):
+        """
+        Yields the events of a time window in timestamp order.
+
+        :param log_group_name: Name of the log group.
+        :param start: Start of the window, a datetime or epoch milliseconds.
+        :param end: End of the window (inclusive), a datetime or epoch milliseconds.
+        :param stream_names: Only fetch these log streams, defaults to all of them.
+        :param filter_pattern: A CloudWatch Logs filter pattern.
+        :param slices: Number of time slices, defaults to the number of workers.
+        :param prefetch: Number of time slices fetched ahead of the consumer, which
+                         bounds the memory used, defaults to the number of workers.
+        :return: A generator of the events.
+        """
+        start, end = _to_millis(start), _to_millis(end)
+        slices = max(1, min(slices or self.workers, end - start + 1))
+        step = (end - start + 1) / slices
+        bounds = [start + int(step * idx) for idx in range(slices)] + [end + 1]
+        # Both ends of a filter_log_events window are inclusive.
+        windows = iter([(bounds[idx], bounds[idx + 1] - 1) for idx in range(slices)
+                        if bounds[idx] < bounds[idx + 1]])
+        groups = [None]
+        if stream_names:
+            stream_names = list(stream_names)
+            groups = [stream_names[idx:idx + LOG_STREAMS_LIMIT]
+                      for idx in range(0, len(stream_names), LOG_STREAMS_LIMIT)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+
+            def submit_next():
+                window = next(windows, None)
+                if window is not None:
+                    pending.append([
+                        executor.submit(self._fetch_shard, log_group_name,
+                                        window[0], window[1], group, filter_pattern)
+                        for group in groups
+                    ])
+
+            for _ in range(prefetch or self.workers):
+                submit_next()
+            while pending:
+                shards = pending.popleft()
+                submit_next()
+                yield from heapq.merge(*(shard.result() for shard in shards),
+                                       key=_event_order)
+
+    def tail(self, log_group_name, stream_names=None, filter_pattern=None, start=None,
+             poll_interval=2.0, lag_seconds=30.0):
+        """
+        Follows a log group, yielding the new events as they arrive. Every poll
+        only asks for the events since the last one seen, minus a lag which
+        catches the events ingested late, and the already yielded events are
+        skipped.
+
+        :param start: Where to start from, defaults to now.
+        :param poll_interval: Seconds between two polls.
+        :param lag_seconds: How far back every poll looks for late events.
+        :return: An endless generator of events.
+        """
+        since = _to_millis(start) if start is not None else int(time.time() * 1000)
+        # The lag never reaches back before the requested start, the events
+        # older than it are not part of the tail.
+        first = since
+        lag = int(lag_seconds * 1000)
+        seen = {}
+        while True:
+            now = int(time.time() * 1000)
+            lower = max(first, since - lag)
+            for event in self.fetch(log_group_name, lower, now,
+                                    stream_names, filter_pattern, slices=1):
+                if event['eventId'] in seen or event['timestamp'] < lower:
+                    continue
+                seen[event['eventId']] = event['timestamp']
+                since = max(since, event['timestamp'])
+                yield event
+            seen = {event_id: timestamp for event_id, timestamp in seen.items()
+                    if timestamp >= since - lag}
+            time.sleep(poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Outputs the log groups above a volume of IncomingBytes.')
+    parser.add_argument('--threshold-gb', type=float, default=1.0,
+                        help='Minimum volume of a log group, in GB.')
+    parser.add_argument('--days', type=float, default=7,
+                        help='Size of the time window, in days.')
+    parser.add_argument('--format', choices=['text', 'csv', 'json'], default='text')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of concurrent GetMetricData calls.')
+    parser.add_argument('--region', default=None)
+    args = parser.parse_args(argv)
+
+    report = log_group_ingestion_report(
+        get_client('logs', region_name=args.region),
+        get_client('cloudwatch', region_name=args.region),
+        threshold_gb=args.threshold_gb, days=args.days, workers=args.workers
+    )
+    write_report(report, args.format)
+
+
+if __name__ == '__main__':
+    main()
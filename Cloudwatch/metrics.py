@@ -0,0 +1,247 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from datetime import datetime as dt
+from botocore.exceptions import ClientError
+from Common.clients import get_client
+
+
+# PutMetricData accepts at most 1000 metrics and 1MB per call.
+MAX_DATUMS_PER_CALL = 1000
+MAX_PAYLOAD_BYTES = 1000 * 1000
+# A MetricDatum holds at most 150 distinct Values.
+MAX_DISTINCT_VALUES = 150
+# An Embedded Metric Format metric holds at most 100 values.
+MAX_EMF_VALUES = 100
+
+
+class _Aggregate(object):
+    """
+    The datapoints of one metric and dimension set since the last flush.
+    """
+    __slots__ = ('counts', 'keep_values', 'sample_count', 'sum', 'minimum', 'maximum')
+
+    def __init__(self, keep_values=False) -> None:
+        self.counts = {}
+        self.keep_values = keep_values
+        self.sample_count = 0
+        self.sum = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value, count):
+        if self.counts is not None:
+            self.counts[value] = self.counts.get(value, 0) + count
+            if len(self.counts) > MAX_DISTINCT_VALUES and not self.keep_values:
+                # Too many distinct values, only the statistics are kept.
+                self.counts = None
+        self.sample_count += count
+        self.sum += value * count
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+
+def _emf_distribution(counts):
+    """
+    The EMF value of (value, count) pairs: their Values, Counts and statistic set.
+    """
+    return {
+        'Values': [value for value, _ in counts],
+        'Counts': [float(count) for _, count in counts],
+        'Max': max(value for value, _ in counts),
+        'Min': min(value for value, _ in counts),
+        'Count': float(sum(count for _, count in counts)),
+        'Sum': sum(value * count for value, count in counts),
+    }
+
+
+class MetricPublisher(object):
+    """
+    Publishes custom metrics without calling PutMetricData for every datapoint.
+    Datapoints are aggregated in memory per metric and dimension set, as
+    Values/Counts while there are few distinct values and as StatisticValues
+    otherwise, then flushed in full size PutMetricData batches by a background
+    thread every flush_interval seconds, when max_metrics are buffered and at exit.
+
+    With sink='emf' the metrics are written as Embedded Metric Format JSON lines
+    instead, which Lambda ships to CloudWatch from its logs without any API call.
+    EMF metrics are written as Values/Counts pairs of at most 100 distinct
+    values with their statistic set, a metric is flushed once it reaches 150
+    distinct values, and Count metrics are written as their sum.
+
+        metrics = MetricPublisher(namespace='MyJob')
+        metrics.put('ItemsProcessed', 1, unit='Count', dimensions={'Stage': 'load'})
+    """
+
+    def __init__(self, client=None, namespace='Custom', flush_interval=10.0,
+                 max_metrics=MAX_DATUMS_PER_CALL, sink='api', stream=None) -> None:
+        """
+        :param client: The Boto3 CloudWatch client, used by the 'api' sink,
+                       defaults to the shared one.
+        :param namespace: Namespace of the metrics.
+        :param flush_interval: Seconds between two flushes.
+        :param max_metrics: Number of buffered metric/dimension sets which
+                            triggers a flush.
+        :param sink: 'api' for PutMetricData, 'emf' for Embedded Metric Format.
+        :param stream: Where the EMF lines are written, defaults to stdout.
+        """
+        if sink not in ('api', 'emf'):
+            raise ValueError(f"sink must be 'api' or 'emf', not {sink!r}")
+        if sink == 'api' and client is None:
+            client = get_client('cloudwatch')
+        self.client = client
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.max_metrics = max_metrics
+        self.sink = sink
+        self.stream = stream
+        self.counters = {'datapoints': 0, 'datums': 0, 'calls': 0, 'errors': 0}
+        self._buffer = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, name, value, unit='None', dimensions=None, count=1):
+        """
+        Records a datapoint.
+
+        :param name: The metric name.
+        :param value: The value of the datapoint.
+        :param unit: The CloudWatch unit, e.g. 'Count' or 'Milliseconds'.
+        :param dimensions: A dict of dimension names to values.
+        :param count: Number of times the value was observed.
+        """
+        key = (name, unit, tuple(sorted((dimensions or {}).items())))
+        with self._lock:
+            aggregate = self._buffer.get(key)
+            if aggregate is None:
+                aggregate = self._buffer[key] = _Aggregate(keep_values=self.sink == 'emf')
+            aggregate.add(float(value), count)
+            self.counters['datapoints'] += count
+            full = len(self._buffer) >= self.max_metrics or \
+                (aggregate.keep_values and len(aggregate.counts) >= MAX_DISTINCT_VALUES)
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Sends every buffered metric.
+        """
+        with self._flush_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, {}
+            if not buffer:
+                return
+            if self.sink == 'emf':
+                self._write_emf(buffer)
+            else:
+                self._put_metric_data(buffer)
+
+    def close(self):
+        """
+        Stops the background thread and flushes the remaining metrics.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'Error: Publishing the metrics: {e}')
+
+    def _put_metric_data(self, buffer):
+        timestamp = dt.utcnow()
+        batch, size = [], 0
+        for key, aggregate in buffer.items():
+            datum = self._datum(key, aggregate, timestamp)
+            datum_size = len(json.dumps(datum, default=str))
+            if batch and (len(batch) == MAX_DATUMS_PER_CALL or
+                          size + datum_size > MAX_PAYLOAD_BYTES):
+                self._send(batch)
+                batch, size = [], 0
+            batch.append(datum)
+            size += datum_size
+        if batch:
+            self._send(batch)
+
+    def _datum(self, key, aggregate, timestamp):
+        name, unit, dimensions = key
+        datum = {
+            'MetricName': name,
+            'Dimensions': [{'Name': k, 'Value': str(v)} for k, v in dimensions],
+            'Timestamp': timestamp,
+            'Unit': unit
+        }
+        if aggregate.counts is not None:
+            datum['Values'] = list(aggregate.counts)
+            datum['Counts'] = [float(count) for count in aggregate.counts.values()]
+        else:
+            datum['StatisticValues'] = {
+                'SampleCount': float(aggregate.sample_count),
+                'Sum': aggregate.sum,
+                'Minimum': aggregate.minimum,
+                'Maximum': aggregate.maximum
+            }
+        return datum
+
+    def _send(self, batch):
+        try:
+            self.client.put_metric_data(Namespace=self.namespace, MetricData=batch)
+            self.counters['calls'] += 1
+            self.counters['datums'] += len(batch)
+        except ClientError as e:
+            self.counters['errors'] += 1
+            print(f'Error: Putting {len(batch)} metrics to {self.namespace}')
+            print(e)
+
+    def _write_emf(self, buffer):
+        stream = self.stream or sys.stdout
+        timestamp = int(time.time() * 1000)
+        for (name, unit, dimensions), aggregate in buffer.items():
+            if unit == 'Count':
+                # A counter is written as its aggregated sum, one value per flush
+                # whatever the number of datapoints.
+                chunks = [[aggregate.sum]]
+            else:
+                # Other metrics are written as Values/Counts pairs with their
+                # statistic set, so a hot metric is not one value per datapoint.
+                counts = list(aggregate.counts.items())
+                chunks = [_emf_distribution(counts[start:start + MAX_EMF_VALUES])
+                          for start in range(0, len(counts), MAX_EMF_VALUES)]
+            for chunk in chunks:
+                document = {
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [[k for k, _ in dimensions]],
+                            'Metrics': [{'Name': name, 'Unit': unit}]
+                        }]
+                    },
+                    name: chunk
+                }
+                document.update((k, str(v)) for k, v in dimensions)
+                stream.write(json.dumps(document) + '\n')
+            self.counters['datums'] += 1
+        stream.flush()
@@ -0,0 +1,104 @@
+"""
+A process wide pool of boto3 clients.
+
+Creating a client takes tens of milliseconds and every client opens its own
+connections, so clients are created once per (service, region, endpoint,
+credentials) and shared: clients are thread safe. Resources are not, they are
+cached per thread instead.
+
+    from Common.clients import get_client
+    ec2 = get_client('ec2', region_name='eu-west-1')
+"""
+import threading
+
+
+# Connections kept open per client, the botocore default of 10 is too low for
+# the thread pools of this repository.
+MAX_POOL_CONNECTIONS = 50
+
+_config = None
+_clients = {}
+_sessions = {}
+# Sessions are not thread safe, clients and resources are created under the lock.
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _credentials_key(credentials):
+    if not credentials:
+        return None
+    return (credentials.get('aws_access_key_id'),
+            credentials.get('aws_secret_access_key'),
+            credentials.get('aws_session_token'))
+
+
+def _session(profile_name, credentials):
+    # boto3 is imported on the first client, importing it takes longer than
+    # everything else this repository imports.
+    global _config
+    import boto3
+    from botocore.config import Config
+    if _config is None:
+        _config = Config(max_pool_connections=MAX_POOL_CONNECTIONS, tcp_keepalive=True)
+    key = (profile_name, _credentials_key(credentials))
+    session = _sessions.get(key)
+    if session is None:
+        session = _sessions[key] = boto3.session.Session(
+            profile_name=profile_name, **(credentials or {}))
+    return session
+
+
+def get_client(service, region_name=None, endpoint_url=None, profile_name=None,
+               credentials=None):
+    """
+    Returns the shared client of a service.
+
+    :param service: The service name, e.g. 'ec2'.
+    :param region_name: The region, defaults to the configured one.
+    :param endpoint_url: A custom endpoint, e.g. DynamoDB Local.
+    :param profile_name: A profile of the AWS config files.
+    :param credentials: A dict with aws_access_key_id, aws_secret_access_key
+                        and optionally aws_session_token.
+    :return: The boto3 client.
+    """
+    key = (service, region_name, endpoint_url, profile_name, _credentials_key(credentials))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _session(profile_name, credentials).client(
+                service, region_name=region_name, endpoint_url=endpoint_url,
+                config=_config)
+    return client
+
+
+def get_resource(service, region_name=None, endpoint_url=None, profile_name=None,
+                 credentials=None):
+    """
+    Returns the resource of a service for the calling thread, see get_client()
+    for the arguments.
+    """
+    resources = getattr(_local, 'resources', None)
+    if resources is None:
+        resources = _local.resources = {}
+    key = (service, region_name, endpoint_url, profile_name, _credentials_key(credentials))
+    resource = resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = resources[key] = _session(profile_name, credentials).resource(
+                service, region_name=region_name, endpoint_url=endpoint_url,
+                config=_config)
+    return resource
+
+
+def clear():
+    """
+    Drops the cached clients and sessions, e.g. after the credentials changed.
+    Resources of other threads are kept until those threads end.
+    """
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
+    _local.resources = {}
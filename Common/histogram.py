@@ -0,0 +1,107 @@
+import threading
+
+
+class LatencyHistogram(object):
+    """
+    A thread safe, HDR style histogram of latencies. Values are recorded in
+    microseconds into log-linear buckets: every power of two is split in
+    2**precision_bits sub buckets, so the memory stays small whatever the range
+    and percentiles are exact to within 1 / 2**precision_bits (0.8% by default).
+
+        histogram = LatencyHistogram()
+        histogram.record(0.0123)
+        histogram.percentile(99)
+    """
+
+    def __init__(self, precision_bits=7) -> None:
+        """
+        :param precision_bits: Number of bits of sub buckets per power of two.
+        """
+        self.precision_bits = precision_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self._lock = threading.Lock()
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.precision_bits - 1)
+        return shift, value >> shift
+
+    @staticmethod
+    def _highest(bucket):
+        shift, sub_bucket = bucket
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        """
+        Records a latency, in seconds.
+        """
+        value = max(0, int(round(seconds * 1000000)))
+        bucket = self._bucket(value)
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+            self.count += count
+            self.total += value * count
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other):
+        """
+        Adds the values of another histogram of the same precision.
+        """
+        with other._lock:
+            counts = dict(other.counts)
+            count, total = other.count, other.total
+            minimum, maximum = other.minimum, other.maximum
+        if not count:
+            return
+        with self._lock:
+            for bucket, bucket_count in counts.items():
+                self.counts[bucket] = self.counts.get(bucket, 0) + bucket_count
+            self.count += count
+            self.total += total
+            self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+            self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+
+    def percentile(self, percent):
+        """
+        Returns the latency, in seconds, below which percent of the values fall,
+        or None without values.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            wanted = max(1, -(-self.count * percent // 100))
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= wanted:
+                    value = min(self._highest(bucket), self.maximum)
+                    return max(value, self.minimum) / 1000000
+        return self.maximum / 1000000
+
+    def summary(self, percents=(50, 95, 99)):
+        """
+        Returns the count, min, mean, max and percentiles, in seconds.
+        """
+        summary = {'count': self.count}
+        if not self.count:
+            return summary
+        summary['min'] = self.minimum / 1000000
+        summary['mean'] = self.total / self.count / 1000000
+        for percent in percents:
+            summary[f'p{percent}'] = self.percentile(percent)
+        summary['max'] = self.maximum / 1000000
+        return summary
+
+    def report(self, percents=(50, 95, 99)):
+        """
+        Returns the summary as one line of milliseconds.
+        """
+        summary = self.summary(percents)
+        if not self.count:
+            return 'no values'
+        return ', '.join([f"count={summary['count']}"] + [
+            f'{name}={value * 1000:.1f}ms' for name, value in summary.items() if name != 'count'])
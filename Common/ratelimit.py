@@ -0,0 +1,74 @@
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    A thread safe token bucket. Tokens are added at `rate` per second up to
+    `capacity`, and callers block in acquire() until enough tokens are
+    available. charge() takes tokens without waiting and may leave the bucket
+    in debt, which is how costs only known after a request are accounted for.
+    A rate of None means the bucket never blocks.
+    """
+
+    def __init__(self, rate, capacity=None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate or 0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1.0):
+        """
+        Blocks until the tokens are available and takes them.
+
+        :param tokens: Number of tokens, a cost above the capacity only waits
+                       for a full bucket.
+        :return: Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                if not self.rate:
+                    return waited
+                self._refill(time.monotonic())
+                needed = min(tokens, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, tokens):
+        """
+        Takes tokens without waiting, a negative value gives tokens back.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - tokens)
+
+    def drain(self):
+        """
+        Empties the bucket, without cancelling a debt.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0)
+
+    def set_rate(self, rate, capacity=None):
+        """
+        Changes the refill rate (and optionally the capacity) of the bucket.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self.tokens = min(self.tokens, capacity)
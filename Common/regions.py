@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Common.clients import get_client
+
+
+# Service of the client every wrapper class is constructed with.
+SERVICES = {
+    'EC2Instance': 'ec2',
+    'Inventory': 'ec2',
+    'AutoScaleUserData': 'ec2',
+    'CloudWatch': 'cloudwatch',
+    'MetricPublisher': 'cloudwatch',
+    'LogFetcher': 'logs',
+    'LambdaAPI': 'lambda',
+    'Group': 'iam',
+}
+# Default keyword arguments of the wrappers which don't take a client, so every
+# region is reached through its AWS endpoint, e.g. not DynamoDB Local.
+REGIONAL_KWARGS = {
+    'Modeltable': {'url': True},
+}
+
+
+def enabled_regions(profile_name=None):
+    """
+    Returns the names of the regions enabled for the account.
+
+    :param profile_name: A profile of the AWS config files.
+    """
+    response = get_client('ec2', profile_name=profile_name).describe_regions()
+    return sorted(region['RegionName'] for region in response['Regions'])
+
+
+class RegionExecutor(object):
+    """
+    Runs a method of a wrapper class in many regions concurrently, one wrapper
+    (and so one client) per region, and yields the results as the regions
+    finish, so a slow region never holds back the others. The thread pool is
+    the concurrency cap shared by every run() of the executor.
+
+        with RegionExecutor(max_workers=10) as executor:
+            for region, result in executor.run(EC2Instance, 'describe_instances'):
+                ...
+
+    Wrappers which don't take a client, like Modeltable, are constructed with
+    region_name and profile_name keyword arguments and reach the AWS endpoint
+    of the region unless init_kwargs says otherwise, any other construction goes
+    through a factory. A Modeltable instance may be passed instead of the class,
+    its in_region() then builds the wrapper of every region, so they use the
+    endpoint and profile of the instance instead of the defaults:
+
+        executor.run(Modeltable('Movies', url=True), 'get_data', (2021, 'Venom'))
+    """
+
+    def __init__(self, max_workers=10, profile_name=None) -> None:
+        """
+        :param max_workers: Maximum number of calls running at the same time.
+        :param profile_name: A profile of the AWS config files.
+        """
+        self.profile_name = profile_name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _default_factory(self, wrapper, init_args, init_kwargs):
+        if not isinstance(wrapper, type) and hasattr(wrapper, 'in_region'):
+            return wrapper.in_region
+        service = SERVICES.get(wrapper.__name__)
+
+        def factory(region):
+            if service is None:
+                kwargs = dict(REGIONAL_KWARGS.get(wrapper.__name__, {}),
+                              profile_name=self.profile_name)
+                kwargs.update(init_kwargs)
+                return wrapper(*init_args, region_name=region, **kwargs)
+            client = get_client(service, region_name=region, profile_name=self.profile_name)
+            return wrapper(client, *init_args, **init_kwargs)
+        return factory
+
+    def _call(self, factory, region, method, args, kwargs):
+        result = getattr(factory(region), method)(*args, **kwargs)
+        if hasattr(result, '__next__'):
+            # Generators are consumed here, not lazily in the caller's thread.
+            result = list(result)
+        return result
+
+    def run(self, wrapper, method, args=(), kwargs=None, regions=None,
+            init_args=(), init_kwargs=None, factory=None):
+        """
+        Calls wrapper(...).method(*args, **kwargs) in every region.
+
+        :param wrapper: The wrapper class, e.g. EC2Instance, or a wrapper with
+                        an in_region() method, e.g. a Modeltable.
+        :param method: Name of the method to call.
+        :param args: Positional arguments of the method.
+        :param kwargs: Keyword arguments of the method.
+        :param regions: Region names, defaults to every enabled region.
+        :param init_args: Arguments of the wrapper after the client.
+        :param init_kwargs: Keyword arguments of the wrapper.
+        :param factory: A callable returning the wrapper of a region, replaces
+                        the default construction.
+        :return: A generator of (region, result) in completion order, the result
+                 being the exception raised when the call failed.
+        """
+        regions = regions or enabled_regions(self.profile_name)
+        factory = factory or self._default_factory(wrapper, init_args, init_kwargs or {})
+        futures = {
+            self.executor.submit(self._call, factory, region, method, args, kwargs or {}): region
+            for region in regions
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def fan_out(wrapper, method, *args, regions=None, max_workers=10, profile_name=None,
+            **kwargs):
+    """
+    Runs wrapper(client).method(*args, **kwargs) in every region with a one off
+    RegionExecutor, see RegionExecutor.run().
+
+    :return: A generator of (region, result or exception) in completion order.
+    """
+    with RegionExecutor(max_workers, profile_name) as executor:
+        yield from executor.run(wrapper, method, args, kwargs, regions)
@@ -0,0 +1,290 @@
+"""
+Retries, backoff and waiting for AWS to converge.
+
+    retrier = Retrier({'InvalidParameterValueException': {'max_attempts': 6}},
+                      base=1.0, cap=30.0, deadline=120.0, name='create_function')
+    response = retrier.call(client.create_function, **kwargs)
+
+    wait_until(lambda: client.get_function(FunctionName=name)['Configuration']['State']
+               == 'Active', timeout=300, description=f'{name} active')
+"""
+import functools
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+
+
+THROTTLING_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'RequestThrottledException',
+    'SlowDown',
+)
+
+
+def decorrelated_jitter(previous, base=0.1, cap=20.0):
+    """
+    Returns the next decorrelated jitter delay: random between the base and three
+    times the previous delay, capped. Retries of concurrent clients spread out
+    faster than with plain exponential backoff.
+    """
+    return min(cap, random.uniform(base, max(base, previous) * 3))
+
+
+def error_code(error):
+    """
+    Returns the AWS error code of a ClientError, the code of an Incomplete and
+    None for other exceptions.
+    """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    if isinstance(error, Incomplete):
+        return Incomplete.code
+    return None
+
+
+class Incomplete(Exception):
+    """
+    Raised by a retried function which only did part of its work, e.g. a batch
+    call returning unprocessed items, so the rest is retried with backoff. The
+    remaining work is kept in `remaining` for when the attempts run out.
+    """
+    code = 'Incomplete'
+
+    def __init__(self, remaining, message='Part of the work is left to do.') -> None:
+        super().__init__(message)
+        self.remaining = remaining
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a service while its circuit breaker is open.
+    """
+
+
+class WaitTimeout(Exception):
+    """
+    Raised by wait_until() when the condition does not hold in time.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a failing service: after failure_threshold consecutive
+    failures the circuit opens and calls fail fast with CircuitOpenError. After
+    reset_timeout seconds one trial call is let through (half open), its
+    success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """
+        Raises CircuitOpenError unless a call may go through.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpenError(f'Circuit open after {self.failures} consecutive failures.')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class Retrier(object):
+    """
+    Calls a function, retrying the errors of its policies with decorrelated
+    jitter backoff until it succeeds, the attempts of the policy run out or
+    the deadline passes, then the last error is raised. Every error code can
+    have its own max_attempts, base and cap. Counters of the calls, retries per
+    code and time waited are kept in stats(), and sent to a MetricPublisher
+    when one is given.
+    """
+
+    def __init__(self, policies=THROTTLING_CODES, max_attempts=8, base=0.1, cap=20.0,
+                 deadline=None, breaker=None, metrics=None, name=None,
+                 classify=error_code) -> None:
+        """
+        :param policies: The error codes to retry, either a list of codes or a dict
+                         of code to overrides of max_attempts, base and cap.
+        :param max_attempts: Attempts in total, including the first one.
+        :param base: Shortest delay between two attempts, in seconds.
+        :param cap: Longest delay between two attempts, in seconds.
+        :param deadline: Seconds after which no new attempt is made.
+        :param breaker: A CircuitBreaker shared by the calls of a service.
+        :param metrics: A Cloudwatch.metrics.MetricPublisher.
+        :param name: The operation name, the Operation dimension of the metrics.
+        :param classify: Returns the code an exception is retried under, None to
+                         raise it, defaults to error_code().
+        """
+        if not isinstance(policies, dict):
+            policies = {code: {} for code in policies}
+        self.policies = policies
+        self.defaults = {'max_attempts': max_attempts, 'base': base, 'cap': cap}
+        self.deadline = deadline
+        self.breaker = breaker
+        self.metrics = metrics
+        self.name = name
+        self.classify = classify
+        self.counters = {'calls': 0, 'attempts': 0, 'retries': 0, 'gave_up': 0,
+                         'rejected': 0, 'waited_seconds': 0.0, 'retries_by_code': {}}
+        self._lock = threading.Lock()
+
+    def __call__(self, func):
+        """
+        Use as a decorator, every call of the function is retried.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+    def policy(self, code):
+        """
+        Returns the max_attempts, base and cap of an error code, None when the
+        error is not retried.
+        """
+        if code not in self.policies:
+            return None
+        return dict(self.defaults, **(self.policies[code] or {}))
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) with retries.
+
+        :return: The return value of the function.
+        """
+        self._count(calls=1)
+        start = time.monotonic()
+        attempt, delay = 0, 0.0
+        while True:
+            if self.breaker is not None:
+                try:
+                    self.breaker.allow()
+                except CircuitOpenError:
+                    self._count(rejected=1)
+                    raise
+            attempt += 1
+            self._count(attempts=1)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                code = self.classify(e)
+                policy = self.policy(code)
+                if policy is None:
+                    # The service answered, e.g. a failed condition, which says
+                    # nothing about its health.
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    raise
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                delay = decorrelated_jitter(delay or policy['base'], policy['base'], policy['cap'])
+                out_of_time = self.deadline is not None and \
+                    time.monotonic() - start + delay > self.deadline
+                if attempt >= policy['max_attempts'] or out_of_time:
+                    self._count(gave_up=1)
+                    raise
+                self._record_retry(code, delay)
+                time.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _record_retry(self, code, delay):
+        with self._lock:
+            self.counters['retries'] += 1
+            self.counters['waited_seconds'] += delay
+            by_code = self.counters['retries_by_code']
+            by_code[code] = by_code.get(code, 0) + 1
+        if self.metrics is not None:
+            dimensions = {'Operation': self.name or 'unknown', 'ErrorCode': code}
+            self.metrics.put('Retries', 1, unit='Count', dimensions=dimensions)
+            self.metrics.put('RetryWait', delay, unit='Seconds', dimensions=dimensions)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['retries_by_code'] = dict(self.counters['retries_by_code'])
+        return stats
+
+
+def wait_until(condition, timeout=300.0, interval=1.0, max_interval=30.0, backoff=1.5,
+               ignore_codes=(), description='condition', metrics=None):
+    """
+    Polls a condition until it holds, the interval between two polls growing by
+    `backoff` up to max_interval. Returns as soon as the condition holds instead
+    of sleeping for a fixed time.
+
+    :param condition: A callable, the condition holds when it returns a truthy value.
+    :param timeout: Seconds after which WaitTimeout is raised.
+    :param interval: Seconds before the second poll.
+    :param max_interval: Longest interval between two polls.
+    :param backoff: Growth factor of the interval.
+    :param ignore_codes: Error codes of the condition meaning "not yet", e.g.
+                         'ResourceNotFoundException'.
+    :param description: What is waited for, used in the messages.
+    :param metrics: A Cloudwatch.metrics.MetricPublisher, the wait time is sent
+                    as the WaitTime metric.
+    :return: The truthy value returned by the condition.
+    """
+    start = time.monotonic()
+    polls = 0
+    while True:
+        polls += 1
+        try:
+            value = condition()
+        except ClientError as e:
+            if error_code(e) not in ignore_codes:
+                raise
+            value = None
+        elapsed = time.monotonic() - start
+        if value:
+            if metrics is not None:
+                metrics.put('WaitTime', elapsed, unit='Seconds',
+                            dimensions={'Condition': description})
+            return value
+        if elapsed + interval > timeout:
+            raise WaitTimeout(f'{description} did not hold after {elapsed:.0f}s '
+                              f'and {polls} polls.')
+        time.sleep(interval)
+        interval = min(max_interval, interval * backoff)
@@ -0,0 +1,173 @@
+import threading
+import time
+from botocore.exceptions import ClientError
+from Common.ratelimit import TokenBucket
+from Common.retry import THROTTLING_CODES
+
+
+# Read units of a full 1 MB scan or query page read with eventual consistency,
+# the estimate of the first page of an operation.
+MAX_PAGE_READ_UNITS = 128.0
+# Weight of the last page in the estimate of the next one.
+ESTIMATE_WEIGHT = 0.3
+
+
+def consumed_capacity(response):
+    """
+    Sums the CapacityUnits reported by a response, batch and transaction calls
+    report a list with one entry per table.
+    """
+    consumed = response.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(capacity.get('CapacityUnits', 0.0) for capacity in consumed)
+
+
+class CapacityLimiter(object):
+    """
+    Keeps the traffic of a table within its provisioned throughput. Every request
+    takes an estimate of its cost from a read or write token bucket and is then
+    charged what DynamoDB reports in ConsumedCapacity. The allowed rate follows
+    AIMD: it is halved when a request is throttled and grows back linearly
+    towards the provisioned capacity while requests succeed.
+
+    Pages of scans and queries can cost anything from 0.5 to 128 units, their
+    estimate is the moving average of what the previous pages of the same
+    operation consumed, starting from the cost of a full page.
+
+    The limiter doesn't retry, a throttled request is raised after slowing down
+    the rate so the retries of the caller wait for new tokens.
+    """
+
+    def __init__(self, read_capacity, write_capacity, burst_seconds=1.0,
+                 min_fraction=0.1, recovery_per_second=0.1) -> None:
+        """
+        :param read_capacity: Provisioned read capacity units, None for on-demand.
+        :param write_capacity: Provisioned write capacity units, None for on-demand.
+        :param burst_seconds: Seconds of capacity that can be used in a burst.
+        :param min_fraction: Lowest rate, as a fraction of the capacity, after throttling.
+        :param recovery_per_second: Fraction of the capacity the rate grows back
+                                    per second without throttling.
+        """
+        self.limits = {'read': read_capacity, 'write': write_capacity}
+        self.burst_seconds = burst_seconds
+        self.min_fraction = min_fraction
+        self.recovery_per_second = recovery_per_second
+        self.buckets = {kind: TokenBucket(limit, limit * burst_seconds if limit else None)
+                        for kind, limit in self.limits.items()}
+        self.counters = {'throttled': 0, 'waited_seconds': 0.0,
+                         'read_units': 0.0, 'write_units': 0.0}
+        self._last_adjusted = {kind: time.monotonic() for kind in self.limits}
+        self._page_estimates = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_table(cls, description, **kwargs):
+        """
+        Creates the limiter from a describe_table response. Tables in on-demand
+        mode report no provisioned throughput and are not limited.
+        """
+        table = description['Table']
+        throughput = table.get('ProvisionedThroughput', {})
+        on_demand = table.get('BillingModeSummary', {}).get('BillingMode') == 'PAY_PER_REQUEST'
+        return cls(
+            None if on_demand else throughput.get('ReadCapacityUnits') or None,
+            None if on_demand else throughput.get('WriteCapacityUnits') or None,
+            **kwargs
+        )
+
+    def rate(self, kind):
+        return self.buckets[kind].rate
+
+    def acquire(self, kind, estimate=1.0):
+        waited = self.buckets[kind].acquire(estimate)
+        if waited:
+            with self._lock:
+                self.counters['waited_seconds'] += waited
+
+    def page_estimate(self, operation):
+        """
+        Returns the expected read units of the next page of an operation, e.g. 'scan'.
+        """
+        with self._lock:
+            return self._page_estimates.get(operation, MAX_PAGE_READ_UNITS)
+
+    def record(self, kind, consumed, estimate=1.0, operation=None):
+        """
+        Charges the difference between the consumed capacity and the estimate
+        taken before the request.
+
+        :param operation: The operation of a paged read, its estimate is updated.
+        """
+        self.buckets[kind].charge(consumed - estimate)
+        with self._lock:
+            self.counters[f'{kind}_units'] += consumed
+            if operation is not None:
+                previous = self._page_estimates.get(operation, consumed)
+                self._page_estimates[operation] = \
+                    ESTIMATE_WEIGHT * consumed + (1 - ESTIMATE_WEIGHT) * previous
+
+    def on_throttle(self, kind):
+        """
+        Multiplicative decrease of the rate after a throttled request, the bucket is
+        also drained so the retries wait for new tokens.
+        """
+        limit = self.limits[kind]
+        with self._lock:
+            self.counters['throttled'] += 1
+            self._last_adjusted[kind] = time.monotonic()
+        if limit:
+            self.buckets[kind].set_rate(
+                max(limit * self.min_fraction, self.buckets[kind].rate / 2))
+            self.buckets[kind].drain()
+
+    def on_success(self, kind):
+        """
+        Additive increase of the rate, proportional to the time since the last change.
+        """
+        limit = self.limits[kind]
+        bucket = self.buckets[kind]
+        if not limit or bucket.rate >= limit:
+            return
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._last_adjusted[kind]
+            self._last_adjusted[kind] = now
+        bucket.set_rate(min(limit, bucket.rate + limit * self.recovery_per_second * elapsed))
+
+    def call(self, kind, func, estimate=1.0, **kwargs):
+        """
+        Calls an API within the capacity. A throttled request slows the rate down
+        and is raised, retrying it is left to the caller.
+
+        :param kind: 'read' or 'write'.
+        :param func: The client or table method to call.
+        :param estimate: Expected capacity units of the request, None for a page of
+                         a scan or query, estimated from the previous pages.
+        :param kwargs: Arguments of the call, ReturnConsumedCapacity is added.
+        :return: The response of the call.
+        """
+        kwargs.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        operation = None
+        if estimate is None:
+            operation = func.__name__
+            estimate = self.page_estimate(operation)
+        self.acquire(kind, estimate)
+        try:
+            response = func(**kwargs)
+        except ClientError as e:
+            # A failed request consumes no capacity.
+            self.record(kind, 0.0, estimate)
+            if e.response['Error']['Code'] in THROTTLING_CODES:
+                self.on_throttle(kind)
+            raise
+        self.record(kind, consumed_capacity(response), estimate, operation)
+        self.on_success(kind)
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['read_rate'] = self.rate('read')
+        stats['write_rate'] = self.rate('write')
+        return stats
@@ -0,0 +1,117 @@
+import functools
+import os
+import re
+from collections import namedtuple
+
+
+def _load_reserved_keywords():
+    filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'reserved_dynamodb_keywords.txt')
+    with open(filepath) as f_ptr:
+        return frozenset(line.strip().upper() for line in f_ptr if line.strip())
+
+
+RESERVED_KEYWORDS = _load_reserved_keywords()
+
+# Attribute names which can be used as is in an expression.
+_SAFE_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+# A path segment with optional list indexes, e.g. "actors[0]".
+_SEGMENT = re.compile(r'^(.+?)((?:\[\d+\])*)$')
+
+
+class CompiledUpdate(namedtuple('CompiledUpdate', ['expression', 'names', 'placeholders'])):
+    """
+    A compiled "SET" UpdateExpression, reusable for every update of the same shape.
+
+    expression: The UpdateExpression string.
+    names: The ExpressionAttributeNames for the escaped path segments.
+    placeholders: Maps every attribute path to its value placeholder.
+    """
+    __slots__ = ()
+
+    def bind(self, values):
+        """
+        Binds the values of an update to the compiled expression.
+
+        :param values: A dict mapping the attribute paths to their new values.
+        :return: The UpdateExpression, ExpressionAttributeNames and
+                 ExpressionAttributeValues keyword arguments of update_item.
+        """
+        kwargs = {
+            'UpdateExpression': self.expression,
+            'ExpressionAttributeValues': {
+                placeholder: values[path] for path, placeholder in self.placeholders.items()
+            }
+        }
+        if self.names:
+            kwargs['ExpressionAttributeNames'] = dict(self.names)
+        return kwargs
+
+
+def needs_escaping(name):
+    """
+    Tells whether an attribute name is a reserved keyword or contains characters
+    which can't be used in an expression without a '#name' placeholder.
+    """
+    return name.upper() in RESERVED_KEYWORDS or not _SAFE_NAME.match(name)
+
+
+def escape_path(path, names):
+    """
+    Escapes the segments of an attribute path which need a placeholder.
+
+    :param path: An attribute path, e.g. 'info.rating' or 'info.actors[0]'.
+    :param names: ExpressionAttributeNames dict the placeholders are added to.
+    :return: The path to use in the expression, e.g. '#p0.rating'.
+    """
+    placeholders = {name: key for key, name in names.items()}
+    segments = []
+    for segment in path.split('.'):
+        name, indexes = _SEGMENT.match(segment).groups()
+        if needs_escaping(name):
+            if name not in placeholders:
+                placeholders[name] = f'#p{len(names)}'
+                names[placeholders[name]] = name
+            name = placeholders[name]
+        segments.append(name + indexes)
+    return '.'.join(segments)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_update(paths):
+    names = {}
+    placeholders = {}
+    assignments = []
+    for idx, path in enumerate(paths):
+        placeholders[path] = f':p{idx}'
+        assignments.append(f'{escape_path(path, names)}={placeholders[path]}')
+    return CompiledUpdate('SET ' + ', '.join(assignments), names, placeholders)
+
+
+def compile_update(paths):
+    """
+    Compiles a "SET" UpdateExpression for the attribute paths. Expressions are
+    memoized by the set of paths, so updates of the same shape are a lookup.
+
+    :param paths: The attribute paths to set, e.g. ['info.rating', 'info.plot'].
+    :return: A CompiledUpdate.
+    """
+    return _compile_update(tuple(sorted(paths)))
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_projection(paths):
+    names = {}
+    expression = ', '.join(escape_path(path, names) for path in paths)
+    return expression, names
+
+
+def compile_projection(paths):
+    """
+    Compiles a ProjectionExpression for the attribute paths.
+
+    :param paths: The attribute paths to return, e.g. ['year', 'info.genres'].
+    :return: The projection expression and its ExpressionAttributeNames.
+    """
+    expression, names = _compile_projection(tuple(paths))
+    return expression, dict(names)
@@ -0,0 +1,344 @@
+"""
+Compact, memory-mappable table snapshots.
+
+Layout of a snapshot file, integers are little endian:
+
+    magic                       8 bytes, b'DDBSNAP2'
+    key names                   [u32 length][JSON list of the key attribute names]
+    records                     [u32 length][encoded item] ...
+    index entries               [u32 key length][key][u64 record offset] ...
+                                sorted by key
+    index table                 u64 offset of every index entry, so the sorted
+                                index can be binary searched in place
+    footer                      u64 index offset, u64 index table offset,
+                                u64 record count, magic
+
+Values are encoded from the DynamoDB wire format ({'N': '2000'}), which keeps
+numbers, sets and binaries exact, as a type tag followed by varint prefixed
+data, so a record holds the attribute names and values and little else. A key
+is the encoding of its key attribute values, so lookups never load more than
+the records they hit.
+"""
+import heapq
+import json
+import mmap
+import struct
+import tempfile
+
+
+MAGIC = b'DDBSNAP2'
+_LENGTH = struct.Struct('<I')
+_OFFSET = struct.Struct('<Q')
+_FOOTER = struct.Struct('<QQQ8s')
+# Index entries held in memory by a writer, beyond they are spilled to a
+# temporary file as a sorted run, and the runs are merged on close.
+INDEX_RUN_SIZE = 100000
+
+# Type tags of the encoded values.
+_STRINGS = {'S': 1, 'N': 2, 'B': 3}
+_SETS = {'SS': 9, 'NS': 10, 'BS': 11}
+_TRUE, _FALSE, _NULL, _MAP, _LIST = 4, 5, 6, 7, 8
+_KINDS = {tag: kind for kind, tag in list(_STRINGS.items()) + list(_SETS.items())}
+
+_serializer = None
+_deserializer = None
+
+
+def _types():
+    # boto3 is imported by the first encode or decode, not with the module.
+    global _serializer, _deserializer
+    if _serializer is None:
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+        _deserializer = TypeDeserializer()
+        _serializer = TypeSerializer()
+    return _serializer, _deserializer
+
+
+def _bytes(value):
+    # Binary values of the deserializer, plain bytes are left as they are.
+    return getattr(value, 'value', value)
+
+
+def _put_varint(out, number):
+    while number >= 0x80:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _get_varint(data, pos):
+    number = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def _put_data(out, kind, data):
+    data = _bytes(data) if kind in ('B', 'BS') else data.encode()
+    _put_varint(out, len(data))
+    out += data
+
+
+def _get_data(data, pos, kind):
+    length, pos = _get_varint(data, pos)
+    value = bytes(data[pos:pos + length])
+    return (value if kind in ('B', 'BS') else value.decode()), pos + length
+
+
+def _put_value(out, value):
+    (kind, data), = value.items()
+    if kind in _STRINGS:
+        out.append(_STRINGS[kind])
+        _put_data(out, kind, data)
+    elif kind in _SETS:
+        out.append(_SETS[kind])
+        _put_varint(out, len(data))
+        for member in data:
+            _put_data(out, kind, member)
+    elif kind == 'BOOL':
+        out.append(_TRUE if data else _FALSE)
+    elif kind == 'NULL':
+        out.append(_NULL)
+    elif kind == 'M':
+        out.append(_MAP)
+        _put_map(out, data)
+    else:
+        out.append(_LIST)
+        _put_varint(out, len(data))
+        for member in data:
+            _put_value(out, member)
+
+
+def _get_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag in (_TRUE, _FALSE):
+        return {'BOOL': tag == _TRUE}, pos
+    if tag == _NULL:
+        return {'NULL': True}, pos
+    if tag == _MAP:
+        value, pos = _get_map(data, pos)
+        return {'M': value}, pos
+    if tag == _LIST:
+        count, pos = _get_varint(data, pos)
+        members = []
+        for _ in range(count):
+            member, pos = _get_value(data, pos)
+            members.append(member)
+        return {'L': members}, pos
+    kind = _KINDS[tag]
+    if kind in _SETS:
+        count, pos = _get_varint(data, pos)
+        members = []
+        for _ in range(count):
+            member, pos = _get_data(data, pos, kind)
+            members.append(member)
+        return {kind: members}, pos
+    value, pos = _get_data(data, pos, kind)
+    return {kind: value}, pos
+
+
+def _put_map(out, attributes):
+    _put_varint(out, len(attributes))
+    for name, value in attributes.items():
+        _put_data(out, 'S', name)
+        _put_value(out, value)
+
+
+def _get_map(data, pos):
+    count, pos = _get_varint(data, pos)
+    attributes = {}
+    for _ in range(count):
+        name, pos = _get_data(data, pos, 'S')
+        attributes[name], pos = _get_value(data, pos)
+    return attributes, pos
+
+
+def encode_item(item):
+    serializer, _ = _types()
+    out = bytearray()
+    _put_map(out, {k: serializer.serialize(v) for k, v in item.items()})
+    return bytes(out)
+
+
+def decode_item(data):
+    _, deserializer = _types()
+    attributes, _ = _get_map(data, 0)
+    return {k: deserializer.deserialize(v) for k, v in attributes.items()}
+
+
+def encode_key(key, key_names):
+    """
+    Returns the index key of an item (or of a key dict).
+    """
+    serializer, _ = _types()
+    out = bytearray()
+    for name in key_names:
+        _put_value(out, serializer.serialize(key[name]))
+    return bytes(out)
+
+
+def _write_entries(f_ptr, entries):
+    for key, offset in entries:
+        f_ptr.write(_LENGTH.pack(len(key)) + key + _OFFSET.pack(offset))
+
+
+def _read_entries(f_ptr):
+    f_ptr.seek(0)
+    while True:
+        header = f_ptr.read(_LENGTH.size)
+        if not header:
+            return
+        (length,) = _LENGTH.unpack(header)
+        key = f_ptr.read(length)
+        (offset,) = _OFFSET.unpack(f_ptr.read(_OFFSET.size))
+        yield key, offset
+
+
+class SnapshotWriter(object):
+    """
+    Writes items to a snapshot file, the key index is written on close. At most
+    index_run_size index entries are kept in memory, the others wait in sorted
+    runs on disk.
+    """
+
+    def __init__(self, filepath, key_names, index_run_size=INDEX_RUN_SIZE) -> None:
+        self.key_names = list(key_names)
+        self.count = 0
+        self.index_run_size = index_run_size
+        self._index = []
+        self._runs = []
+        self._f_ptr = open(filepath, 'wb')
+        header = json.dumps(self.key_names).encode()
+        self._f_ptr.write(MAGIC + _LENGTH.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, item):
+        data = encode_item(item)
+        self._index.append((encode_key(item, self.key_names), self._f_ptr.tell()))
+        self._f_ptr.write(_LENGTH.pack(len(data)))
+        self._f_ptr.write(data)
+        self.count += 1
+        if len(self._index) >= self.index_run_size:
+            self._spill()
+
+    def _spill(self):
+        run = tempfile.TemporaryFile()
+        self._index.sort()
+        _write_entries(run, self._index)
+        self._runs.append(run)
+        self._index = []
+
+    def close(self):
+        if self._f_ptr.closed:
+            return
+        self._index.sort()
+        index_offset = self._f_ptr.tell()
+        # The entry offsets wait on disk too, they are as many as the items.
+        with tempfile.TemporaryFile() as table:
+            for key, offset in heapq.merge(self._index,
+                                           *(_read_entries(run) for run in self._runs)):
+                table.write(_OFFSET.pack(self._f_ptr.tell()))
+                _write_entries(self._f_ptr, ((key, offset),))
+            table_offset = self._f_ptr.tell()
+            table.seek(0)
+            while True:
+                chunk = table.read(1024 * 1024)
+                if not chunk:
+                    break
+                self._f_ptr.write(chunk)
+        self._f_ptr.write(_FOOTER.pack(index_offset, table_offset, self.count, MAGIC))
+        self._f_ptr.close()
+        for run in self._runs:
+            run.close()
+        self._index = []
+        self._runs = []
+
+
+class Snapshot(object):
+    """
+    Read access to a memory mapped snapshot file: sequential iteration over the
+    items and binary searched lookups by key.
+    """
+
+    def __init__(self, filepath) -> None:
+        self._f_ptr = open(filepath, 'rb')
+        self._map = mmap.mmap(self._f_ptr.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{filepath} is not a table snapshot.')
+        self._index_offset, self._table_offset, self.count, magic = \
+            _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{filepath} is a truncated table snapshot.')
+        (length,) = _LENGTH.unpack_from(self._map, len(MAGIC))
+        self._records_offset = len(MAGIC) + _LENGTH.size + length
+        self.key_names = json.loads(self._map[len(MAGIC) + _LENGTH.size:self._records_offset])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for data in self.iter_raw():
+            yield decode_item(data)
+
+    def iter_raw(self):
+        """
+        Yields the encoded records in file order.
+        """
+        offset = self._records_offset
+        while offset < self._index_offset:
+            (length,) = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            yield self._map[offset:offset + length]
+            offset += length
+
+    def _entry(self, position):
+        (entry,) = _OFFSET.unpack_from(self._map, self._table_offset + position * _OFFSET.size)
+        (length,) = _LENGTH.unpack_from(self._map, entry)
+        entry += _LENGTH.size
+        (offset,) = _OFFSET.unpack_from(self._map, entry + length)
+        return self._map[entry:entry + length], offset
+
+    def get(self, key):
+        """
+        Looks up an item by its key attributes, e.g. {'year': 2021, 'title': 'Venom'}.
+
+        :return: The item or None.
+        """
+        wanted = encode_key(key, self.key_names)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found, offset = self._entry(low)
+            if found == wanted:
+                (length,) = _LENGTH.unpack_from(self._map, offset)
+                start = offset + _LENGTH.size
+                return decode_item(self._map[start:start + length])
+        return None
+
+    def close(self):
+        if not self._map.closed:
+            self._map.close()
+        self._f_ptr.close()
@@ -1,20 +1,215 @@
+import argparse
+import os
 import pprint
-import boto3
+import queue
+import threading
+import time
 import json
 import sys
 from decimal import Decimal
-from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+from Common.clients import get_resource
+from Common.retry import Incomplete, Retrier
+from DynamoDb.cache import TTLCache
+from DynamoDb.capacity import CapacityLimiter
+from DynamoDb.expressions import compile_projection, compile_update
+from DynamoDb.snapshot import Snapshot, SnapshotWriter
+
+
+# BatchWriteItem accepts at most 25 put/delete requests per call.
+BATCH_WRITE_LIMIT = 25
+# BatchGetItem accepts at most 100 keys per call.
+BATCH_GET_LIMIT = 100
+
+
+def iter_json_records(source, chunk_size=1 << 20):
+    """
+    Lazily yields the records of a JSON array (or JSON lines) document, reading
+    it in chunks so the whole document never has to sit in memory.
+
+    :param source: A file path, an open file object or an iterable of records.
+    :param chunk_size: Number of characters read from the file at a time.
+    :return: A generator of records, floats are parsed as Decimal.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source) as f_ptr:
+            yield from iter_json_records(f_ptr, chunk_size)
+        return
+    if not hasattr(source, 'read'):
+        yield from source
+        return
+
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    buffer, pos, eof = '', 0, False
+    while True:
+        # Skip the array brackets, separators and whitespace between records.
+        while pos < len(buffer) and buffer[pos] in '[],\r\n\t ':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                return
+            buffer, pos = source.read(chunk_size), 0
+            eof = not buffer
+            continue
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = source.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield record
+
+
+def projection_kwargs(attributes):
+    """
+    Returns the ProjectionExpression (and ExpressionAttributeNames when a path
+    needs escaping) keyword arguments for the attribute paths.
+    """
+    expression, names = compile_projection(attributes)
+    kwargs = {'ProjectionExpression': expression}
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    return kwargs
+
+
+class ScanCheckpoint(object):
+    """
+    Keeps the progress of a parallel scan, the LastEvaluatedKey of every segment
+    and the segments which are finished, so an interrupted scan can be resumed.
+    """
+
+    def __init__(self, total_segments) -> None:
+        self.total_segments = total_segments
+        self.last_keys = {}
+        self.done = set()
+
+    def save(self, filepath):
+        """
+        Saves the checkpoint as JSON, keys are stored in the DynamoDB wire format
+        so numbers survive the round trip.
+        """
+        from boto3.dynamodb.types import TypeSerializer
+        serializer = TypeSerializer()
+        with open(filepath, 'w') as f_ptr:
+            json.dump({
+                'total_segments': self.total_segments,
+                'done': sorted(self.done),
+                'last_keys': {
+                    str(segment): {k: serializer.serialize(v) for k, v in key.items()}
+                    for segment, key in self.last_keys.items()
+                }
+            }, f_ptr)
+
+    @classmethod
+    def load(cls, filepath):
+        from boto3.dynamodb.types import TypeDeserializer
+        deserializer = TypeDeserializer()
+        with open(filepath) as f_ptr:
+            data = json.load(f_ptr)
+        checkpoint = cls(data['total_segments'])
+        checkpoint.done = set(data['done'])
+        checkpoint.last_keys = {
+            int(segment): {k: deserializer.deserialize(v) for k, v in key.items()}
+            for segment, key in data['last_keys'].items()
+        }
+        return checkpoint
 
 
 class Modeltable(object):
-    def __init__(self, table, url=None) -> None:
-        if not url:
-            self.client = boto3.resource(
-                'dynamodb', endpoint_url='http://localhost:8000')
-        else:
-            self.client = boto3.resource('dynamodb')
-        self.table = self.client.Table('Movies')
+    def __init__(self, table, url=None, cache_size=0, cache_ttl=60.0,
+                 region_name=None, profile_name=None, endpoint_url=None) -> None:
+        """
+        :param table: Name of the table.
+        :param url: When not provided, DynamoDB Local on localhost:8000 is used.
+        :param cache_size: Number of items kept in the read-through cache of
+                           get_data and get_many, 0 disables the cache.
+        :param cache_ttl: Seconds a cached item is served before it is read again.
+        :param region_name: Region of the table, defaults to the configured one.
+        :param profile_name: A profile of the AWS config files.
+        :param endpoint_url: A custom endpoint, takes precedence over url.
+        """
+        if endpoint_url is None and not url:
+            endpoint_url = 'http://localhost:8000'
+        self.table_name = table
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.profile_name = profile_name
+        # Resources are not thread safe, client and table are resolved for the
+        # calling thread, see the properties below.
+        self._local = threading.local()
+        # The resource client is thread safe, unlike the resource objects, and
+        # still (de)serializes python types for us.
+        self.ddb_client = self.client.meta.client
+        self.cache = TTLCache(cache_size, cache_ttl) if cache_size else None
+        self.limiter = None
+        # The only retries of throttled calls, the limiter and the batch loops
+        # don't retry them again.
+        self.retrier = Retrier(max_attempts=8, base=0.05, cap=5.0, name=table)
+
+    @property
+    def client(self):
+        """
+        The DynamoDB service resource of the calling thread.
+        """
+        return get_resource('dynamodb', region_name=self.region_name,
+                            endpoint_url=self.endpoint_url, profile_name=self.profile_name)
+
+    @property
+    def table(self):
+        """
+        The Table resource of the calling thread.
+        """
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            table = self._local.table = self.client.Table(self.table_name)
+        return table
+
+    def in_region(self, region_name):
+        """
+        Returns the Modeltable of the same table in another region, reached
+        through the same endpoint and profile as this one, e.g. for
+        RegionExecutor.run(). The cache settings are kept, the limiter is not.
+
+        :param region_name: The region of the returned table.
+        """
+        return Modeltable(
+            self.table_name, url=self.endpoint_url is None,
+            cache_size=self.cache.maxsize if self.cache else 0,
+            cache_ttl=self.cache.ttl if self.cache else 60.0,
+            region_name=region_name, profile_name=self.profile_name,
+            endpoint_url=self.endpoint_url)
+
+    def enable_rate_limit(self, **kwargs):
+        """
+        Limits every data plane call of the table to its provisioned throughput,
+        read from describe_table. See CapacityLimiter for the arguments.
+
+        :return: The CapacityLimiter shared by the calls of this table.
+        """
+        description = self.ddb_client.describe_table(TableName=self.table_name)
+        self.limiter = CapacityLimiter.from_table(description, **kwargs)
+        print(f"Rate limiting {self.table_name} to {self.limiter.limits['read']} RCU "
+              f"and {self.limiter.limits['write']} WCU")
+        return self.limiter
+
+    def _call(self, kind, func, estimate=1.0, **kwargs):
+        """
+        Calls a read or write API through the capacity limiter, when enabled, and
+        retries it while it is throttled.
+
+        :param estimate: Expected capacity units, None for a page of a scan or query.
+        """
+        if self.limiter is None:
+            return self.retrier.call(func, **kwargs)
+        return self.retrier.call(self.limiter.call, kind, func, estimate, **kwargs)
+
+    def _invalidate(self, year, title):
+        if self.cache is not None:
+            self.cache.invalidate((year, title))
 
     def create_table(self, tablename, **kwargs):
         try:
@@ -51,9 +246,7 @@ class Modeltable(object):
 
     def describe_table(self, tablename):
         try:
-            client = boto3.client(
-                'dynamodb', endpoint_url='http://localhost:8000')
-            response = client.describe_table(
+            response = self.ddb_client.describe_table(
                 TableName=tablename
             )
             return response
@@ -69,71 +262,486 @@ class Modeltable(object):
                 year = int(_it['year'])
                 title = _it['title']
                 print(f'Putting movie {title}, {year}')
-                self.table.put_item(
+                self._call(
+                    'write', self.table.put_item,
                     Item=_it
                 )
+                self._invalidate(_it['year'], title)
         except ClientError as e:
             print(e)
         except Exception as e:
             print(e)
 
+    def bulk_put_data(self, source, workers=4, max_retries=8):
+        """
+        Bulk loads the movies with BatchWriteItem. The input is parsed as a stream
+        and grouped into batches of 25 items which are written by a pool of
+        writer threads, unprocessed items are retried with a jittered backoff.
+
+        :param source: A JSON file path, an open file object or an iterable of records.
+        :param workers: Number of concurrent writer threads.
+        :param max_retries: Number of retries for unprocessed items of a batch.
+        :return: Summary with the written and failed item counts,
+                 items/sec and the consumed write capacity units.
+        """
+        return self._bulk_write(
+            self._iter_put_batches(iter_json_records(source)),
+            workers=workers, max_retries=max_retries)
+
+    def _iter_put_batches(self, records, key_names=('year', 'title')):
+        """
+        Groups records into BatchWriteItem put requests. A batch must
+        not contain the same key twice, so the latest record for a key wins.
+
+        :param key_names: The key attributes every record must have.
+        """
+        batch = {}
+        for record in records:
+            if any(name not in record for name in key_names):
+                print(f'Skipping record without {" and ".join(map(repr, key_names))}: '
+                      f'{str(record)[:80]}')
+                continue
+            batch[tuple(record[name] for name in key_names)] = {
+                'PutRequest': {'Item': record}}
+            if len(batch) == BATCH_WRITE_LIMIT:
+                yield list(batch.values())
+                batch = {}
+        if batch:
+            yield list(batch.values())
+
+    def _write_batch(self, requests, max_retries):
+        """
+        Writes a single batch, retrying the unprocessed items. Throttled calls are
+        retried by _call().
+
+        :return: The consumed capacity units and the requests which could not be written.
+        """
+        consumed = 0.0
+        pending = {'requests': requests}
+
+        def write():
+            nonlocal consumed
+            response = self._call(
+                'write', self.ddb_client.batch_write_item, len(pending['requests']),
+                RequestItems={self.table_name: pending['requests']},
+                ReturnConsumedCapacity='TOTAL'
+            )
+            for capacity in response.get('ConsumedCapacity', []):
+                consumed += capacity.get('CapacityUnits', 0)
+            pending['requests'] = response.get(
+                'UnprocessedItems', {}).get(self.table_name, [])
+            if pending['requests']:
+                if self.limiter is not None:
+                    self.limiter.on_throttle('write')
+                raise Incomplete(pending['requests'])
+
+        retrier = Retrier((Incomplete.code,), max_attempts=max_retries + 1, base=0.05,
+                          cap=5.0, name='batch_write_item')
+        try:
+            retrier.call(write)
+        except Incomplete:
+            pass
+        return consumed, pending['requests']
+
+    def _bulk_write(self, batches, workers=4, max_retries=8):
+        """
+        Feeds the batches to a pool of writer threads through a bounded queue, so
+        only a few batches are held in memory at a time. A batch which raises is
+        counted as failed, and the producer stops once no writer is left, so the
+        queue can never block it forever.
+        """
+        pending = queue.Queue(maxsize=workers * 2)
+        lock = threading.Lock()
+        stop = threading.Event()
+        stats = {'items': 0, 'failed': 0, 'consumed_wcu': 0.0}
+        alive = [max(1, workers)]
+
+        def writer():
+            try:
+                while True:
+                    requests = pending.get()
+                    if requests is None:
+                        return
+                    try:
+                        consumed, unprocessed = self._write_batch(
+                            requests, max_retries)
+                    except Exception as e:
+                        print(f'Error: Writing a batch of {len(requests)} items to '
+                              f'{self.table_name}: {e!r}')
+                        consumed, unprocessed = 0.0, requests
+                    except BaseException:
+                        with lock:
+                            stats['failed'] += len(requests)
+                        raise
+                    if self.cache is not None:
+                        for request in requests:
+                            item = request['PutRequest']['Item']
+                            self._invalidate(item.get('year'), item.get('title'))
+                    with lock:
+                        stats['items'] += len(requests) - len(unprocessed)
+                        stats['failed'] += len(unprocessed)
+                        stats['consumed_wcu'] += consumed
+            finally:
+                with lock:
+                    alive[0] -= 1
+                    if not alive[0]:
+                        stop.set()
+
+        def offer(message):
+            while not stop.is_set():
+                try:
+                    pending.put(message, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        threads = [threading.Thread(target=writer, daemon=True)
+                   for _ in range(max(1, workers))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            for batch in batches:
+                if not offer(batch):
+                    # Every writer is gone, the batch is not written.
+                    with lock:
+                        stats['failed'] += len(batch)
+        finally:
+            for _ in threads:
+                offer(None)
+            for thread in threads:
+                thread.join()
+            # The batches left behind by the writers which are gone.
+            while not pending.empty():
+                batch = pending.get()
+                if batch is not None:
+                    stats['failed'] += len(batch)
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['items_per_sec'] = stats['items'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"Wrote {stats['items']} items to {self.table_name} in "
+              f"{stats['seconds']:.1f}s ({stats['items_per_sec']:.0f} items/sec, "
+              f"{stats['consumed_wcu']:.1f} WCUs consumed, {stats['failed']} failed)")
+        return stats
+
+    def parallel_scan(self, total_segments=None, workers=None, projection=None,
+                      filter_expression=None, checkpoint=None, max_pages_buffered=None):
+        """
+        Scans the whole table by splitting it into segments which are read
+        concurrently by a thread pool. Items are yielded as their pages arrive and
+        at most a few pages are buffered, so memory stays bounded.
+
+        :param total_segments: Number of segments to split the table into,
+                               defaults to the number of workers.
+        :param workers: Number of concurrent scanning threads, defaults to twice
+                        the number of cores.
+        :param projection: A list of attribute paths to return.
+        :param filter_expression: A boto3 condition, e.g. Attr('info.rating').gte(5).
+        :param checkpoint: A ScanCheckpoint to resume from. It is updated once all
+                           the items of a page have been consumed, save it to be
+                           able to resume an interrupted scan. A resumed scan
+                           repeats the items of partially consumed pages.
+        :param max_pages_buffered: Number of pages which can wait to be consumed.
+        :return: A generator of items.
+        """
+        workers = workers or (os.cpu_count() or 1) * 2
+        if checkpoint is None:
+            checkpoint = ScanCheckpoint(total_segments or workers)
+        segments = [segment for segment in range(checkpoint.total_segments)
+                    if segment not in checkpoint.done]
+        if not segments:
+            return
+
+        scan_kwargs = {'TableName': self.table_name,
+                       'TotalSegments': checkpoint.total_segments}
+        if projection:
+            scan_kwargs.update(projection_kwargs(projection))
+        if filter_expression is not None:
+            scan_kwargs['FilterExpression'] = filter_expression
+
+        pages = queue.Queue(maxsize=max_pages_buffered or workers * 2)
+        stop = threading.Event()
+
+        def publish(message):
+            while not stop.is_set():
+                try:
+                    pages.put(message, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_segment(segment):
+            kwargs = dict(scan_kwargs, Segment=segment)
+            if segment in checkpoint.last_keys:
+                kwargs['ExclusiveStartKey'] = checkpoint.last_keys[segment]
+            try:
+                while True:
+                    response = self._call('read', self.ddb_client.scan, None, **kwargs)
+                    last_key = response.get('LastEvaluatedKey')
+                    if not publish(('page', segment, response['Items'], last_key)):
+                        return
+                    if not last_key:
+                        return
+                    kwargs['ExclusiveStartKey'] = last_key
+            except Exception as e:
+                publish(('error', segment, e, None))
+
+        remaining = len(segments)
+        with ThreadPoolExecutor(max_workers=min(workers, remaining)) as executor:
+            try:
+                for segment in segments:
+                    executor.submit(scan_segment, segment)
+                while remaining:
+                    kind, segment, payload, last_key = pages.get()
+                    if kind == 'error':
+                        raise payload
+                    yield from payload
+                    # Only checkpoint once every item of the page was consumed.
+                    if last_key:
+                        checkpoint.last_keys[segment] = last_key
+                    else:
+                        checkpoint.last_keys.pop(segment, None)
+                        checkpoint.done.add(segment)
+                        remaining -= 1
+            finally:
+                stop.set()
+
     def get_data(self, year, title):
         try:
+            use_cache = self.cache is not None and title
+            if use_cache:
+                found, item = self.cache.get((year, title))
+                if found:
+                    return {'Item': item} if item is not None else {}
             kwargs = {'year': year}
             if title:
                 kwargs['title'] = title
-            response = self.table.get_item(
+            response = self._call(
+                'read', self.table.get_item, 0.5,
                 Key=kwargs
             )
+            if use_cache:
+                self.cache.set((year, title), response.get('Item'))
             return response
         except ClientError as e:
             print(e)
         except Exception as e:
             print(e)
 
+    def get_many(self, keys, consistent_read=False, max_retries=8):
+        """
+        Looks up many items with BatchGetItem. Duplicate keys are fetched once,
+        keys are sent in chunks of 100 and unprocessed keys are retried.
+
+        :param keys: A list of (year, title) tuples or {'year': .., 'title': ..} dicts.
+        :param consistent_read: Use strongly consistent reads.
+        :param max_retries: Number of retries for the unprocessed keys of a chunk.
+        :return: The items in the order of the keys, None for missing items.
+        """
+        keys = [(key['year'], key['title']) if isinstance(key, dict) else tuple(key)
+                for key in keys]
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            if self.cache is not None:
+                hit, item = self.cache.get(key)
+                if hit:
+                    found[key] = item
+                    continue
+            missing.append(key)
+
+        pending = {}
+
+        def read():
+            response = self._call(
+                'read', self.ddb_client.batch_get_item,
+                len(pending['request'][self.table_name]['Keys']) / 2,
+                RequestItems=pending['request']
+            )
+            for item in response['Responses'].get(self.table_name, []):
+                found[(item['year'], item['title'])] = item
+            pending['request'] = response.get('UnprocessedKeys')
+            if pending['request']:
+                if self.limiter is not None:
+                    self.limiter.on_throttle('read')
+                raise Incomplete(pending['request'])
+
+        retrier = Retrier((Incomplete.code,), max_attempts=max_retries + 1, base=0.05,
+                          cap=5.0, name='batch_get_item')
+        for start in range(0, len(missing), BATCH_GET_LIMIT):
+            chunk = missing[start:start + BATCH_GET_LIMIT]
+            pending['request'] = {self.table_name: {
+                'Keys': [{'year': year, 'title': title} for year, title in chunk],
+                'ConsistentRead': consistent_read
+            }}
+            try:
+                retrier.call(read)
+            except Incomplete as e:
+                raise RuntimeError(
+                    f'Could not read {len(e.remaining[self.table_name]["Keys"])} '
+                    f'keys from {self.table_name} after {max_retries} retries.')
+            if self.cache is not None:
+                for key in chunk:
+                    self.cache.set(key, found.get(key))
+
+        return [found.get(key) for key in keys]
+
     def update_data(self, title, year, actors: None or list, rating=None, plot=None):
+        fields = {}
+        if rating:
+            fields['info.rating'] = rating
+        if plot:
+            fields['info.plot'] = plot
+        if actors:
+            fields['info.actors'] = actors
+        return self.update_fields(year, title, fields)
 
-        update_expression = 'set'
-        update_values = {}
+    def update_fields(self, year, title, fields):
+        """
+        Sets the attributes of an item, the UpdateExpression is compiled once per
+        set of attribute paths and reserved words are escaped.
+
+        :param year: The year of the movie.
+        :param title: The title of the movie.
+        :param fields: A dict mapping attribute paths to values, e.g. {'info.rating': 7}.
+        :return: The response containing the updated attributes.
+        """
+        if not fields:
+            print(f'Nothing to update for movie {title}, {year}')
+            return
         try:
-            if rating:
-                update_expression += ' info.rating=:r'
-                update_values[':r'] = rating
-            if plot:
-                update_expression += ' info.plot=:p'
-                update_values[':p'] = plot
-            if actors:
-                update_expression += ' info.actors=:a'
-                update_values[':a'] = actors
-            response = self.table.update_item(
+            response = self._call(
+                'write', self.table.update_item,
                 Key={
                     'year': year,
                     'title': title
                 },
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=update_values,
-                ReturnValues='UPDATED_NEW'
+                ReturnValues='UPDATED_NEW',
+                **compile_update(fields).bind(fields)
             )
+            self._invalidate(year, title)
             return response
         except ClientError as e:
             print(e)
 
+    def query_pages(self, key_condition, projection=None, filter_expression=None,
+                    limit=None, page_size=None, index_name=None, scan_forward=True):
+        """
+        Lazily queries the table page by page, following LastEvaluatedKey until the
+        results are exhausted or the limit is reached.
+
+        :param key_condition: A boto3 key condition, e.g. Key('year').eq(2000).
+        :param projection: A list of attribute paths to return.
+        :param filter_expression: A boto3 condition applied after the read, the
+                                  filtered out items still consume read capacity.
+        :param limit: Maximum number of items to return over all the pages.
+        :param page_size: Maximum number of items evaluated per request.
+        :param index_name: Name of a secondary index to query instead of the table.
+        :param scan_forward: Sort key order, False for descending.
+        :return: A generator of pages with the 'Items', 'Count', 'ScannedCount'
+                 and 'ConsumedCapacity' of every request.
+        """
+        kwargs = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': scan_forward,
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        if projection:
+            kwargs.update(projection_kwargs(projection))
+        if filter_expression is not None:
+            kwargs['FilterExpression'] = filter_expression
+        if index_name:
+            kwargs['IndexName'] = index_name
+
+        remaining = limit
+        while remaining is None or remaining > 0:
+            sizes = [size for size in (page_size, remaining) if size]
+            # Without a filter every evaluated item is returned, so never read
+            # more than is still needed.
+            if filter_expression is None and sizes:
+                kwargs['Limit'] = min(sizes)
+            elif page_size:
+                kwargs['Limit'] = page_size
+            response = self._call('read', self.ddb_client.query, None, **kwargs)
+            items = response['Items']
+            if remaining is not None:
+                items = items[:remaining]
+                remaining -= len(items)
+            yield {
+                'Items': items,
+                'Count': response['Count'],
+                'ScannedCount': response['ScannedCount'],
+                'ConsumedCapacity': response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+            }
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def iter_query(self, key_condition, **kwargs):
+        """
+        Lazily yields the items of a query over all its pages, takes the same
+        arguments as query_pages.
+        """
+        for page in self.query_pages(key_condition, **kwargs):
+            yield from page['Items']
+
     def query(self, year, title_range=None, year_range=None):
+        from boto3.dynamodb.conditions import Key
         try:
-            response = self.table.query(
-                ProjectionExpression='#yr, title, info.genres, info.actors',
-                ExpressionAttributeNames={"#yr": "year"},
-                KeyConditionExpression=Key('year').eq(year) & Key('title').between(title_range[0], title_range[1]),
-                FilterExpression=Key('info.rating').gte(Decimal(5.0))
-            )
-            return response['Items']
+            key_condition = Key('year').eq(year)
+            if title_range:
+                key_condition = key_condition & Key('title').between(
+                    title_range[0], title_range[1])
+            return list(self.iter_query(
+                key_condition,
+                projection=['year', 'title', 'info.genres', 'info.actors'],
+                filter_expression=Key('info.rating').gte(Decimal(5.0))
+            ))
         except ClientError as e:
             print(e)
 
-if __name__ == '__main__':
+    def snapshot(self, filepath, workers=None):
+        """
+        Writes the whole table to a snapshot file, see DynamoDb/snapshot.py for the
+        format. The table is read with a parallel scan.
+
+        :param filepath: Path of the snapshot file to write.
+        :param workers: Number of concurrent scanning threads.
+        :return: Number of items written.
+        """
+        description = self.ddb_client.describe_table(TableName=self.table_name)
+        key_names = [key['AttributeName'] for key in description['Table']['KeySchema']]
+        start = time.perf_counter()
+        with SnapshotWriter(filepath, key_names) as writer:
+            for item in self.parallel_scan(workers=workers):
+                writer.write(item)
+        print(f'Saved {writer.count} items of {self.table_name} to {filepath} in '
+              f'{time.perf_counter() - start:.1f}s ({os.path.getsize(filepath)} bytes)')
+        return writer.count
+
+    def restore(self, filepath, workers=8, max_retries=8):
+        """
+        Streams a snapshot file back into the table with parallel batch writes.
 
+        :param filepath: Path of the snapshot file.
+        :param workers: Number of concurrent writer threads.
+        :param max_retries: Number of retries for unprocessed items of a batch.
+        :return: The summary of the bulk write.
+        """
+        with Snapshot(filepath) as snapshot:
+            print(f'Restoring {len(snapshot)} items from {filepath} to {self.table_name}')
+            return self._bulk_write(self._iter_put_batches(snapshot, snapshot.key_names),
+                                    workers=workers, max_retries=max_retries)
+
+
+def demo(mt):
+    """
+    Runs the Movies walkthrough against the table.
+    """
     # print('Creating the table: "Movies"...')
-    mt=Modeltable(table = 'Movies')
     # mt.create_table('Movies')
     # print('Table created: "Movies"')
 
@@ -158,6 +766,9 @@ if __name__ == '__main__':
     # print('Adding the file data to the table: "Movies"')
     # mt.put_data(json_data = json_data)
 
+    # print('Bulk loading the file data to the table: "Movies"')
+    # mt.bulk_put_data(filename, workers=8)
+
     # print('Adding a recent movie to the data...')
     # mt.put_data(json_data = test_data)
     # print('Added the recent movie to the data.')
@@ -181,4 +792,32 @@ if __name__ == '__main__':
     movies = mt.query(year, title_range)
     for movie in movies:
         print(f"\n{movie['year']} : {movie['title']}")
-        pprint.pprint(movie['info'])
\ No newline at end of file
+        pprint.pprint(movie['info'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Operations on a DynamoDB table.')
+    parser.add_argument('--table', default='Movies', help='Name of the table.')
+    parser.add_argument('--aws', action='store_true',
+                        help='Use AWS instead of DynamoDB Local on localhost:8000.')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('demo', help='Run the Movies walkthrough.')
+    snapshot = commands.add_parser('snapshot', help='Save the table to a snapshot file.')
+    snapshot.add_argument('filepath')
+    snapshot.add_argument('--workers', type=int, default=None)
+    restore = commands.add_parser('restore', help='Load a snapshot file into the table.')
+    restore.add_argument('filepath')
+    restore.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    mt = Modeltable(table=args.table, url=args.aws)
+    if args.command == 'snapshot':
+        mt.snapshot(args.filepath, workers=args.workers)
+    elif args.command == 'restore':
+        mt.restore(args.filepath, workers=args.workers)
+    else:
+        demo(mt)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,263 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from Common.retry import Retrier, error_code
+from DynamoDb.expressions import compile_update
+
+
+# TransactWriteItems accepts at most 100 actions per call.
+TRANSACT_WRITE_LIMIT = 100
+
+# Throttled calls are retried by Modeltable._call(), not again here.
+_RETRYABLE_ERRORS = (
+    'TransactionConflictException',
+    'TransactionInProgressException',
+)
+# Codes of the CancellationReasons of a TransactionCanceledException, which are
+# not the names of the exceptions. 'None' is the code of the items which did not
+# cause the cancellation.
+_RETRYABLE_REASONS = (
+    'TransactionConflict',
+    'ProvisionedThroughputExceeded',
+    'ThrottlingError',
+)
+
+
+def is_retryable(error):
+    """
+    Tells whether a failed write may succeed when retried. A cancelled
+    transaction is only retried when every item which cancelled it was
+    throttled or conflicting, a failed condition would fail again.
+    """
+    code = error.response['Error']['Code']
+    if code in _RETRYABLE_ERRORS:
+        return True
+    reasons = [reason.get('Code') for reason in error.response.get('CancellationReasons', [])
+               if reason.get('Code') not in (None, 'None')]
+    return bool(reasons) and all(reason in _RETRYABLE_REASONS for reason in reasons)
+
+
+def _retry_code(error):
+    """
+    The code a failed write is retried under by the Retrier, None when it is not.
+    """
+    if isinstance(error, ClientError) and is_retryable(error):
+        return error_code(error)
+    return None
+
+
+def _is_under(path, parent):
+    return path.startswith(parent) and path[len(parent):len(parent) + 1] in ('.', '[')
+
+
+def _set_in(document, path, value):
+    """
+    Returns a copy of a map value with the value set at a dotted path under it.
+    """
+    name, _, rest = path.partition('.')
+    if not isinstance(document, dict) or '[' in name:
+        raise ValueError(f'Cannot merge the update of {path!r} into {document!r}.')
+    document = dict(document)
+    document[name] = _set_in(document.get(name, {}), rest, value) if rest else value
+    return document
+
+
+def merge_fields(pending, fields):
+    """
+    Merges the fields of an update into the pending fields of the same key. An
+    UpdateExpression can't set overlapping paths, so a path drops the pending
+    paths under it, and a path under a pending one is set in its value.
+
+    :param pending: A dict mapping attribute paths to values, updated in place.
+    :param fields: The fields of the new update, later values win.
+    :raises ValueError: When the path can't be set in the pending value, e.g.
+                        through a list index.
+    :return: The pending fields.
+    """
+    for path, value in fields.items():
+        for child in [other for other in pending if _is_under(other, path)]:
+            del pending[child]
+        parent = next((other for other in pending if _is_under(path, other)), None)
+        if parent is None:
+            pending[path] = value
+        else:
+            rest = path[len(parent):]
+            if not rest.startswith('.'):
+                raise ValueError(f'Cannot merge the update of {path!r} into {parent!r}.')
+            pending[parent] = _set_in(pending[parent], rest[1:], value)
+    return pending
+
+
+class UpdateBuffer(object):
+    """
+    Buffers the updates of a Modeltable and merges the pending updates to the
+    same (year, title) key, so a key updated many times within the window is
+    written once. Pending updates are flushed when max_items keys are waiting,
+    when the oldest one waited max_delay seconds, and on close.
+
+    Use it as a context manager:
+
+        with UpdateBuffer(Modeltable('Movies'), max_delay=2.0) as buffer:
+            buffer.update(2021, 'Venom', {'info.rating': 6.3})
+        print(buffer.stats())
+    """
+
+    def __init__(self, table, max_items=100, max_delay=1.0, mode='transact',
+                 workers=8, max_retries=5) -> None:
+        """
+        :param table: The Modeltable to write to.
+        :param max_items: Number of pending keys which triggers a flush.
+        :param max_delay: Seconds an update may wait before it is flushed.
+        :param mode: 'transact' writes chunks of up to 100 updates with
+                     TransactWriteItems (all or nothing per chunk, at twice the
+                     write capacity), 'parallel' sends concurrent UpdateItems.
+        :param workers: Number of concurrent UpdateItem calls in parallel mode.
+        :param max_retries: Number of retries of conflicting writes.
+        """
+        if mode not in ('transact', 'parallel'):
+            raise ValueError(f"mode must be 'transact' or 'parallel', not {mode!r}")
+        self.table = table
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.mode = mode
+        self.max_retries = max_retries
+        self.retrier = Retrier(
+            _RETRYABLE_ERRORS + ('TransactionCanceledException',),
+            max_attempts=max_retries + 1, base=0.05, cap=5.0, name='update_buffer',
+            classify=_retry_code)
+        self.counters = {'submitted': 0, 'written': 0, 'coalesced': 0,
+                         'failed': 0, 'flushes': 0}
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers) if mode == 'parallel' else None
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, year, title, fields):
+        """
+        Queues an update, merging it into a pending update of the same key.
+
+        :param fields: A dict mapping attribute paths to values, later values win.
+                       Overlapping paths are merged, see merge_fields().
+        """
+        if self._closed.is_set():
+            raise RuntimeError('The update buffer is closed.')
+        with self._lock:
+            key = (year, title)
+            if key in self._pending:
+                self._pending[key] = merge_fields(dict(self._pending[key]), fields)
+                self.counters['coalesced'] += 1
+            else:
+                self._pending[key] = merge_fields({}, fields)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+            self.counters['submitted'] += 1
+            full = len(self._pending) >= self.max_items
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every pending update.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._oldest = self._pending, {}, None
+            if not pending:
+                return
+            if self.mode == 'transact':
+                items = list(pending.items())
+                for start in range(0, len(items), TRANSACT_WRITE_LIMIT):
+                    self._write_transaction(items[start:start + TRANSACT_WRITE_LIMIT])
+            else:
+                for ok in self._executor.map(
+                        lambda item: self._write_update(*item), pending.items()):
+                    self._record(ok, 1)
+            with self._lock:
+                self.counters['flushes'] += 1
+            for year, title in pending:
+                self.table._invalidate(year, title)
+
+    def close(self):
+        """
+        Stops the flush timer and writes the remaining updates.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._timer.join()
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def stats(self):
+        """
+        Returns the counters, 'saved' is the number of writes avoided by coalescing.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats['pending'] = len(self._pending)
+        stats['saved'] = stats['coalesced']
+        return stats
+
+    def _record(self, ok, count):
+        with self._lock:
+            self.counters['written' if ok else 'failed'] += count
+
+    def _flush_periodically(self):
+        interval = max(self.max_delay / 4, 0.01)
+        while not self._closed.wait(interval):
+            with self._lock:
+                due = self._oldest is not None and \
+                    time.monotonic() - self._oldest >= self.max_delay
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f'Error: Flushing the buffered updates: {e}')
+
+    def _update_kwargs(self, key, fields):
+        year, title = key
+        return dict(
+            TableName=self.table.table_name,
+            Key={'year': year, 'title': title},
+            **compile_update(fields).bind(fields)
+        )
+
+    def _retry(self, func, estimate=1.0, **kwargs):
+        return self.retrier.call(self.table._call, 'write', func, estimate, **kwargs)
+
+    def _write_transaction(self, items):
+        try:
+            self._retry(
+                self.table.ddb_client.transact_write_items,
+                # Transactional writes cost twice the capacity of plain writes.
+                2.0 * len(items),
+                TransactItems=[{'Update': self._update_kwargs(key, fields)}
+                               for key, fields in items]
+            )
+            self._record(True, len(items))
+        except Exception as e:
+            print(f'Error: Writing a transaction of {len(items)} updates')
+            print(repr(e))
+            self._record(False, len(items))
+
+    def _write_update(self, key, fields):
+        try:
+            self._retry(self.table.ddb_client.update_item,
+                        **self._update_kwargs(key, fields))
+            return True
+        except Exception as e:
+            print(f'Error: Updating movie {key[1]}, {key[0]}')
+            print(repr(e))
+            return False
@@ -1,6 +1,6 @@
-import boto3
 from botocore.exceptions import ClientError
 import base64
+from Common.clients import get_client
 
 
 def encode_base64(filepath):
@@ -16,8 +16,11 @@ def encode_base64(filepath):
 
 
 class AutoScaleUserData(object):
-    def __init__(self, client) -> None:
-        self.client = client
+    def __init__(self, client=None) -> None:
+        """
+        :param client: The Boto3 EC2 client, defaults to the shared one.
+        """
+        self.client = client or get_client('ec2')
 
     def get_vpc_subnet_az(self):
         """
@@ -143,7 +146,7 @@ class AutoScaleUserData(object):
         launch_template_id, launch_template_name = self.create_ec2_launch_template()
         vpc_id, subnet_id, az = self.get_vpc_subnet_az()
 
-        client = boto3.client('autoscaling')
+        client = get_client('autoscaling', region_name=self.client.meta.region_name)
 
         response = client.create_auto_scaling_group(
             AutoScalingGroupName='awspy_autoscaling_group',
@@ -1,19 +1,66 @@
-import boto3
 import pprint
-from requests import get
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from Common.clients import get_client
+from Common.retry import Retrier, error_code
+
+
+# Errors of run_instances after which the launch is retried in another
+# subnet (availability zone) or with another instance type.
+CAPACITY_ERRORS = (
+    'InsufficientInstanceCapacity',
+    'InsufficientCapacity',
+    'Unsupported',
+)
+# Instance IDs accepted by a start/stop/terminate/reboot call.
+STATE_CHANGE_IDS_LIMIT = 1000
+# Errors of a state change call caused by some of its instances, the chunk is
+# split to isolate them. Any other error concerns the whole call.
+BISECT_ERRORS = ('InvalidInstanceID', 'IncorrectInstanceState')
+# Instance IDs accepted by a describe_instance_status call.
+STATUS_IDS_LIMIT = 100
+# Client method and state waited for of every bulk action, a rebooted
+# instance stays 'running' so there is nothing to wait for.
+ACTIONS = {
+    'start': ('start_instances', 'running'),
+    'stop': ('stop_instances', 'stopped'),
+    'terminate': ('terminate_instances', 'terminated'),
+    'reboot': ('reboot_instances', None),
+}
+# States from which an instance will not reach the wanted state any more.
+FINAL_STATES = ('stopped', 'terminated')
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """
+    Nearest rank percentiles of a list of numbers.
+
+    :return: A dict like {'p50': 1.2, 'p90': 3.4, 'p99': 5.6}, empty without values.
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    return {f'p{point}': values[max(0, -(-len(values) * point // 100) - 1)]
+            for point in points}
 
 
 def get_your_public_ip():
     """
     Helper method to find your public IP.
     """
+    # requests is only needed here, importing it takes longer than the module.
+    from requests import get
     ip = get('https://api.ipify.org').text
     return ip
 
 
 class EC2Instance:
-    def __init__(self, client) -> None:
-        self.client = client
+    def __init__(self, client=None) -> None:
+        """
+        :param client: The Boto3 EC2 client (or resource), defaults to the shared client.
+        """
+        self.client = client or get_client('ec2')
 
     def create_key_pair(self, KeyName, DryRun, **kwargs):
         """
@@ -201,20 +248,281 @@ class EC2Instance:
                 )
                 response_id = response['Instances'][0]['InstanceId']
                 print(f'Created EC2 instance {response_id}')
+            return response
         except Exception as e:
             print(e)
 
-    def stop_instances(self):
+    def get_launch_subnets(self):
+        """
+        Returns the default subnet of every availability zone, one per zone.
+        """
+        response = self.client.describe_subnets(
+            Filters=[{'Name': 'default-for-az', 'Values': ['true']},
+                     {'Name': 'state', 'Values': ['available']}]
+        )
+        return sorted(subnet['SubnetId'] for subnet in response['Subnets'])
+
+    def launch_fleet(self, count, key_name=None,
+                     image_id='ami-041d6256ed0f2061c',
+                     instance_types=('t2.micro',),
+                     subnet_ids=None,
+                     security_group_ids=None,
+                     userdata=None,
+                     tags=None,
+                     batch_size=50,
+                     workers=8,
+                     client_token=None):
+        """
+        Launches a fleet of instances spread across subnets (availability zones).
+        The count is split into run_instances calls of up to batch_size instances,
+        round robin over the subnets, and the calls run concurrently. When a call
+        runs out of capacity the remainder is launched in the other subnets, then
+        with the other instance types. Tags and user data are applied at launch.
+        A failed call never loses the instances launched by the other calls, they
+        are returned with the failures.
+
+        :param count: Number of instances to launch.
+        :param key_name: The name of the key pair to connect to the instances.
+        :param image_id: The Amazon Machine Image (AMI) of the instances.
+        :param instance_types: Instance types by order of preference.
+        :param subnet_ids: Subnets to spread the instances over, defaults to the
+                           default subnet of every availability zone.
+        :param security_group_ids: Security group IDs of the instances.
+        :param userdata: The user data script of the instances.
+        :param tags: A dict of tags for the instances and their volumes.
+        :param batch_size: Maximum number of instances per run_instances call.
+        :param workers: Number of concurrent run_instances calls.
+        :param client_token: Idempotency token of the launch, every call gets a
+                             ClientToken derived from it. Launching again with the
+                             same token (and arguments) returns the instances of the
+                             calls which succeeded instead of launching duplicates.
+        :return: The 'instance_ids', the number 'launched', the 'calls' made, with
+                 their subnet, instance type, counts, timing and error, the
+                 'failures' among them and the 'client_token'.
+        """
+        client_token = client_token or uuid.uuid4().hex
+        subnet_ids = list(subnet_ids or self.get_launch_subnets() or [None])
+        instance_types = list(instance_types)
+        # An even share per subnet, each share split in calls of batch_size.
+        batches = []
+        for idx in range(len(subnet_ids)):
+            share = count // len(subnet_ids) + (idx < count % len(subnet_ids))
+            for start in range(0, share, batch_size):
+                batches.append((len(batches), min(batch_size, share - start), idx))
+
+        launch_kwargs = {'ImageId': image_id}
+        if key_name:
+            launch_kwargs['KeyName'] = key_name
+        if security_group_ids:
+            launch_kwargs['SecurityGroupIds'] = list(security_group_ids)
+        if userdata:
+            launch_kwargs['UserData'] = userdata
+        if tags:
+            tag_list = [{'Key': k, 'Value': str(v)} for k, v in tags.items()]
+            launch_kwargs['TagSpecifications'] = [
+                {'ResourceType': 'instance', 'Tags': tag_list},
+                {'ResourceType': 'volume', 'Tags': tag_list},
+            ]
+
+        def launch_batch(batch_idx, size, subnet_idx):
+            # The assigned subnet first, then the other subnets, for each type.
+            order = subnet_ids[subnet_idx:] + subnet_ids[:subnet_idx]
+            candidates = [(subnet_id, instance_type) for instance_type in instance_types
+                          for subnet_id in order]
+            instance_ids, calls = [], []
+            for candidate_idx, (subnet_id, instance_type) in enumerate(candidates):
+                wanted = size - len(instance_ids)
+                kwargs = dict(launch_kwargs, InstanceType=instance_type,
+                              MinCount=1, MaxCount=wanted,
+                              ClientToken=f'{client_token}-{batch_idx}-{candidate_idx}')
+                if subnet_id:
+                    kwargs['SubnetId'] = subnet_id
+                call = {'subnet_id': subnet_id, 'instance_type': instance_type,
+                        'requested': wanted, 'launched': 0, 'error': None}
+                start = time.perf_counter()
+                try:
+                    response = self.client.run_instances(**kwargs)
+                    launched = [i['InstanceId'] for i in response['Instances']]
+                    instance_ids.extend(launched)
+                    call['launched'] = len(launched)
+                except Exception as e:
+                    # Connection errors and timeouts too, the instances launched
+                    # by the earlier calls must still be returned.
+                    call['error'] = error_code(e) or type(e).__name__
+                    if call['error'] not in CAPACITY_ERRORS:
+                        call['seconds'] = time.perf_counter() - start
+                        calls.append(call)
+                        break
+                call['seconds'] = time.perf_counter() - start
+                calls.append(call)
+                if len(instance_ids) >= size:
+                    break
+            return instance_ids, calls
+
+        start = time.perf_counter()
+        result = {'requested': count, 'instance_ids': [], 'calls': []}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for instance_ids, calls in executor.map(lambda batch: launch_batch(*batch), batches):
+                result['instance_ids'].extend(instance_ids)
+                result['calls'].extend(calls)
+        result['launched'] = len(result['instance_ids'])
+        result['failures'] = [call for call in result['calls'] if call['error']]
+        result['client_token'] = client_token
+        result['seconds'] = time.perf_counter() - start
+        print(f"Launched {result['launched']}/{count} instances in "
+              f"{len(result['calls'])} calls over {result['seconds']:.1f}s")
+        return result
+
+    def _change_chunk(self, method, instance_ids, retrier):
+        """
+        Calls a state change API on a chunk of instances. A single bad ID (or an
+        instance in the wrong state) fails the whole call, so such a chunk is split
+        in halves until the failing instances are isolated. Throttled calls are
+        retried by the retrier, other errors are recorded against every instance
+        of the chunk.
+
+        :return: A dict of instance ID to (current state, error code).
+        """
         try:
-            # get the resource instance ID
-            instance_id = self.describe_instances(
-            )['Reservations'][0]['Instances'][0]['InstanceId']
-            response = self.client.stop_instances(
-                InstanceIds=[instance_id]
-            )
-            return response
+            response = retrier.call(getattr(self.client, method), InstanceIds=instance_ids)
         except Exception as e:
-            print(e)
+            code = error_code(e) or type(e).__name__
+            if len(instance_ids) == 1 or not code.startswith(BISECT_ERRORS):
+                # The other chunks carry on, the error is kept per instance.
+                return {instance_id: (None, code) for instance_id in instance_ids}
+            middle = len(instance_ids) // 2
+            outcomes = self._change_chunk(method, instance_ids[:middle], retrier)
+            outcomes.update(self._change_chunk(method, instance_ids[middle:], retrier))
+            return outcomes
+        outcomes = {instance_id: (None, None) for instance_id in instance_ids}
+        for key in ('StartingInstances', 'StoppingInstances', 'TerminatingInstances'):
+            for change in response.get(key, []):
+                outcomes[change['InstanceId']] = (change['CurrentState']['Name'], None)
+        return outcomes
+
+    def _instance_states(self, instance_ids, workers):
+        """
+        Returns the state of the instances, 100 instances per describe_instance_status call.
+        """
+        def describe(chunk):
+            states = {}
+            paginator = self.client.get_paginator('describe_instance_status')
+            for page in paginator.paginate(InstanceIds=chunk, IncludeAllInstances=True):
+                for status in page['InstanceStatuses']:
+                    states[status['InstanceId']] = status['InstanceState']['Name']
+            return states
+
+        chunks = [instance_ids[idx:idx + STATUS_IDS_LIMIT]
+                  for idx in range(0, len(instance_ids), STATUS_IDS_LIMIT)]
+        states = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_states in executor.map(describe, chunks):
+                states.update(chunk_states)
+        return states
+
+    def change_state(self, action, instance_ids=None, inventory=None, wait=True,
+                     timeout=600.0, poll_interval=5.0, workers=4, **criteria):
+        """
+        Starts, stops, terminates or reboots any number of instances, 1000 instances
+        per API call, then waits for all of them with a single describe_instance_status
+        poll loop instead of one waiter per instance.
+
+        :param action: 'start', 'stop', 'terminate' or 'reboot'.
+        :param instance_ids: IDs of the instances, instance_ids or inventory is required.
+        :param inventory: An EC2.inventory.Inventory, the instances matching the
+                          criteria (e.g. state='running', tag=('env', 'dev')) are added.
+        :param wait: Wait until the instances reach the state of the action.
+        :param timeout: Seconds to wait for before giving up.
+        :param poll_interval: Seconds between two polls.
+        :param workers: Number of concurrent API calls.
+        :return: A dict with the 'instances' outcome (state, error and seconds to
+                 reach the state), the 'succeeded' and 'failed' counts and the
+                 'percentiles' of the seconds to reach the state.
+        """
+        method, wanted = ACTIONS[action]
+        if not instance_ids and inventory is None:
+            raise ValueError(f'Nothing to {action}: give the instance_ids or an inventory.')
+        instance_ids = set(instance_ids or ())
+        if inventory is not None:
+            instance_ids.update(inventory.ids(**criteria))
+        instance_ids = sorted(instance_ids)
+        if not instance_ids:
+            print(f'Warning: No instance matches {criteria}, nothing to {action}.')
+        retrier = Retrier(name=method)
+        outcomes = {instance_id: {'state': None, 'error': None, 'seconds': None}
+                    for instance_id in instance_ids}
+
+        start = time.monotonic()
+        chunks = [instance_ids[idx:idx + STATE_CHANGE_IDS_LIMIT]
+                  for idx in range(0, len(instance_ids), STATE_CHANGE_IDS_LIMIT)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for changes in executor.map(
+                    lambda chunk: self._change_chunk(method, chunk, retrier), chunks):
+                for instance_id, (state, error) in changes.items():
+                    outcomes[instance_id]['state'] = state
+                    outcomes[instance_id]['error'] = error
+                    if state is not None and state == wanted:
+                        outcomes[instance_id]['seconds'] = time.monotonic() - start
+
+        pending = [instance_id for instance_id, outcome in outcomes.items()
+                   if outcome['error'] is None and wanted and outcome['state'] != wanted]
+        while wait and pending:
+            if time.monotonic() - start > timeout:
+                for instance_id in pending:
+                    outcomes[instance_id]['error'] = 'Timeout'
+                break
+            time.sleep(poll_interval)
+            states = self._instance_states(pending, workers)
+            still_pending = []
+            for instance_id in pending:
+                outcome = outcomes[instance_id]
+                # Terminated instances eventually disappear from the status.
+                outcome['state'] = states.get(instance_id, 'terminated')
+                if outcome['state'] == wanted:
+                    outcome['seconds'] = time.monotonic() - start
+                elif outcome['state'] in FINAL_STATES:
+                    outcome['error'] = 'UnexpectedState'
+                else:
+                    still_pending.append(instance_id)
+            pending = still_pending
+
+        failed = sum(1 for outcome in outcomes.values() if outcome['error'])
+        report = {
+            'action': action,
+            'instances': outcomes,
+            'succeeded': len(outcomes) - failed,
+            'failed': failed,
+            'seconds': time.monotonic() - start,
+            'percentiles': percentiles([outcome['seconds'] for outcome in outcomes.values()
+                                        if outcome['seconds'] is not None]),
+        }
+        print(f"{action}: {report['succeeded']}/{len(outcomes)} instances succeeded "
+              f"in {report['seconds']:.1f}s {report['percentiles']}")
+        return report
+
+    def start_instances(self, instance_ids=None, inventory=None, wait=True, **kwargs):
+        """
+        Starts the instances, see change_state().
+        """
+        return self.change_state('start', instance_ids, inventory, wait, **kwargs)
+
+    def stop_instances(self, instance_ids=None, inventory=None, wait=True, **kwargs):
+        """
+        Stops the instances, see change_state().
+        """
+        return self.change_state('stop', instance_ids, inventory, wait, **kwargs)
+
+    def terminate_instances(self, instance_ids=None, inventory=None, wait=True, **kwargs):
+        """
+        Terminates the instances, see change_state().
+        """
+        return self.change_state('terminate', instance_ids, inventory, wait, **kwargs)
+
+    def reboot_instances(self, instance_ids=None, inventory=None, **kwargs):
+        """
+        Reboots the instances, see change_state(). There is no state to wait for.
+        """
+        return self.change_state('reboot', instance_ids, inventory, False, **kwargs)
 
     def terminate_instance(self, instance_id):
         """
@@ -0,0 +1,203 @@
+from botocore.exceptions import ClientError
+from Common.clients import get_client
+
+
+# Number of instance IDs sent per describe_instances call on refresh.
+DESCRIBE_IDS_LIMIT = 1000
+
+
+class InstanceRecord(object):
+    """
+    The fields of an EC2 instance kept by the inventory.
+    """
+    __slots__ = ('instance_id', 'state', 'instance_type', 'image_id', 'key_name',
+                 'vpc_id', 'subnet_id', 'availability_zone', 'private_ip',
+                 'public_ip', 'launch_time', 'tags')
+
+    def __init__(self, instance) -> None:
+        """
+        :param instance: An instance of a describe_instances response.
+        """
+        self.instance_id = instance['InstanceId']
+        self.state = instance['State']['Name']
+        self.instance_type = instance.get('InstanceType')
+        self.image_id = instance.get('ImageId')
+        self.key_name = instance.get('KeyName')
+        self.vpc_id = instance.get('VpcId')
+        self.subnet_id = instance.get('SubnetId')
+        self.availability_zone = instance.get('Placement', {}).get('AvailabilityZone')
+        self.private_ip = instance.get('PrivateIpAddress')
+        self.public_ip = instance.get('PublicIpAddress')
+        self.launch_time = instance.get('LaunchTime')
+        self.tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+
+    def __repr__(self):
+        return (f'InstanceRecord({self.instance_id}, {self.state}, '
+                f'{self.instance_type}, {self.availability_zone})')
+
+
+class Inventory(object):
+    """
+    An in-memory inventory of EC2 instances with secondary indexes by state,
+    instance type, tag key, tag key/value, VPC and availability zone.
+
+    refresh() only re-describes the instances which appeared or changed state
+    since the last load, using the lightweight describe_instance_status call to
+    find them. Changes which don't touch the state, like new tags, are only
+    picked up by a full load().
+    """
+
+    _INDEXED = ('state', 'instance_type', 'vpc_id', 'availability_zone')
+
+    def __init__(self, client=None, filters=None) -> None:
+        """
+        :param client: The Boto3 EC2 client, defaults to the shared one.
+        :param filters: Server side describe_instances filters, e.g.
+                        [{'Name': 'tag:team', 'Values': ['data']}].
+        """
+        self.client = client or get_client('ec2')
+        self.filters = filters or []
+        self.instances = {}
+        self._indexes = {name: {} for name in self._INDEXED}
+        self._by_tag = {}
+        self._by_tag_key = {}
+        # State of the instances known not to match the filters.
+        self._excluded = {}
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __iter__(self):
+        return iter(self.instances.values())
+
+    def __contains__(self, instance_id):
+        return instance_id in self.instances
+
+    def _add(self, record):
+        self._remove(record.instance_id)
+        self.instances[record.instance_id] = record
+        for name in self._INDEXED:
+            self._indexes[name].setdefault(getattr(record, name), set()).add(record.instance_id)
+        for key, value in record.tags.items():
+            self._by_tag.setdefault((key, value), set()).add(record.instance_id)
+            self._by_tag_key.setdefault(key, set()).add(record.instance_id)
+
+    def _remove(self, instance_id):
+        record = self.instances.pop(instance_id, None)
+        if record is None:
+            return
+
+        def discard(index, key):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(instance_id)
+                if not ids:
+                    del index[key]
+
+        for name in self._INDEXED:
+            discard(self._indexes[name], getattr(record, name))
+        for key, value in record.tags.items():
+            discard(self._by_tag, (key, value))
+            discard(self._by_tag_key, key)
+
+    def _describe(self, instance_ids=None):
+        kwargs = {'Filters': self.filters}
+        if instance_ids:
+            kwargs['InstanceIds'] = instance_ids
+        for page in self.client.get_paginator('describe_instances').paginate(**kwargs):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    yield InstanceRecord(instance)
+
+    def load(self):
+        """
+        Loads every instance matching the filters, replacing the inventory.
+
+        :return: Number of instances.
+        """
+        records = list(self._describe())
+        self.instances = {}
+        self._indexes = {name: {} for name in self._INDEXED}
+        self._by_tag = {}
+        self._by_tag_key = {}
+        self._excluded = {}
+        for record in records:
+            self._add(record)
+        return len(self.instances)
+
+    def refresh(self):
+        """
+        Re-describes only the instances which are new or whose state changed, and
+        drops the ones which no longer exist.
+
+        :return: A dict with the 'added', 'updated' and 'removed' instance IDs.
+        """
+        states = {}
+        paginator = self.client.get_paginator('describe_instance_status')
+        for page in paginator.paginate(IncludeAllInstances=True):
+            for status in page['InstanceStatuses']:
+                states[status['InstanceId']] = status['InstanceState']['Name']
+
+        changes = {'added': [], 'updated': [], 'removed': []}
+        changed = [instance_id for instance_id, state in states.items()
+                   if (self.instances[instance_id].state if instance_id in self.instances
+                       else self._excluded.get(instance_id)) != state]
+        for instance_id in [i for i in self.instances if i not in states]:
+            self._remove(instance_id)
+            changes['removed'].append(instance_id)
+        self._excluded = {instance_id: state for instance_id, state in self._excluded.items()
+                          if instance_id in states}
+
+        for start in range(0, len(changed), DESCRIBE_IDS_LIMIT):
+            chunk = changed[start:start + DESCRIBE_IDS_LIMIT]
+            try:
+                records = {record.instance_id: record for record in self._describe(chunk)}
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                    raise
+                # An instance vanished in between, fall back to a full load.
+                self.load()
+                return changes
+            for instance_id in chunk:
+                known = instance_id in self.instances
+                if instance_id in records:
+                    self._excluded.pop(instance_id, None)
+                    self._add(records[instance_id])
+                    changes['updated' if known else 'added'].append(instance_id)
+                    continue
+                # Not matching the filters, only described again when its state changes.
+                self._excluded[instance_id] = states[instance_id]
+                if known:
+                    self._remove(instance_id)
+                    changes['removed'].append(instance_id)
+        return changes
+
+    def ids(self, state=None, instance_type=None, vpc_id=None, availability_zone=None,
+            tag=None, tag_key=None):
+        """
+        Returns the IDs of the instances matching every given criteria, each
+        criteria being a lookup in an index.
+
+        :param tag: A (key, value) tuple.
+        :param tag_key: A tag key the instances must have.
+        :return: A set of instance IDs.
+        """
+        lookups = []
+        for name, value in (('state', state), ('instance_type', instance_type),
+                            ('vpc_id', vpc_id), ('availability_zone', availability_zone)):
+            if value is not None:
+                lookups.append(self._indexes[name].get(value, set()))
+        if tag is not None:
+            lookups.append(self._by_tag.get(tuple(tag), set()))
+        if tag_key is not None:
+            lookups.append(self._by_tag_key.get(tag_key, set()))
+        if not lookups:
+            return set(self.instances)
+        lookups.sort(key=len)
+        return set(lookups[0]).intersection(*lookups[1:])
+
+    def find(self, **criteria):
+        """
+        Returns the records of the instances matching the criteria of ids().
+        """
+        return [self.instances[instance_id] for instance_id in self.ids(**criteria)]
@@ -1,7 +1,7 @@
-import boto3
 import pprint
 import json
 from botocore.exceptions import ClientError
+from Common.clients import get_client
 
 
 def check_group_exception(groupname):
@@ -17,8 +17,8 @@ def check_group_exception(groupname):
 
 class Group:
 
-    def __init__(self, client) -> None:
-        self.client = client
+    def __init__(self, client=None) -> None:
+        self.client = client or get_client('iam')
 
     def create_group(self, group_name):
         try:
@@ -64,7 +64,7 @@ class Group:
                     f"You cannot remove the group: {group_name}")
 
             if inline_policy_name:
-                response = client.put_group_policy(
+                response = self.client.put_group_policy(
                     GroupName=group_name,
                     PolicyDocument=inline_policy_document,
                     PolicyName=inline_policy_name,
@@ -87,7 +87,7 @@ class Group:
                 raise BaseException(
                     f"You cannot remove policy from the group: {group_name}")
 
-            response = client.delete_group_policy(
+            response = self.client.delete_group_policy(
                 GroupName=group_name,
                 PolicyName=policy_name,
             )
@@ -140,84 +140,92 @@ class Group:
             return e
 
 
-client = boto3.client('iam')
-
-groupname = 'DemoGroup'
-
-ex = Group(client=client)
-
-# res = ex.create_group(groupname)
-# pprint.pprint(res)
-
-# res1 = ex.attach_group_policy(groupname)
-# pprint.pprint(res1)
-
-policy = {
-    "Version": "2012-10-17",
-    "Statement": [
-        {
-            "Effect": "Allow",
-            "Action": [
-                "ec2:GetLaunchTemplateData",
-                "ec2:TerminateInstances",
-                "ec2:StartInstances",
-                "ec2:CreateTags",
-                "ec2:RunInstances",
-                "ec2:StopInstances"
-            ],
-            "Resource": [
-                "arn:aws:ec2:ap-south-1:*:volume/*",
-                "arn:aws:ec2:ap-south-1:*:network-interface/*",
-                "arn:aws:ec2:ap-south-1:*:instance/*",
-                "arn:aws:ec2:ap-south-1:*:subnet/*",
-                "arn:aws:ec2:ap-south-1:*:security-group/*",
-                "arn:aws:ec2:ap-south-1::image/ami-052cef05d01020f1d "
-            ],
-            "Condition": {
-                "StringEquals": {
-                    "ec2:InstanceType": "t2.micro",
-                    "ec2:Region": "ap-south-1"
+def main():
+    """
+    Demo: attaches an inline policy allowing to run EC2 instances to DemoGroup.
+    """
+    client = get_client('iam')
+
+    groupname = 'DemoGroup'
+
+    ex = Group(client=client)
+
+    # res = ex.create_group(groupname)
+    # pprint.pprint(res)
+
+    # res1 = ex.attach_group_policy(groupname)
+    # pprint.pprint(res1)
+
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "ec2:GetLaunchTemplateData",
+                    "ec2:TerminateInstances",
+                    "ec2:StartInstances",
+                    "ec2:CreateTags",
+                    "ec2:RunInstances",
+                    "ec2:StopInstances"
+                ],
+                "Resource": [
+                    "arn:aws:ec2:ap-south-1:*:volume/*",
+                    "arn:aws:ec2:ap-south-1:*:network-interface/*",
+                    "arn:aws:ec2:ap-south-1:*:instance/*",
+                    "arn:aws:ec2:ap-south-1:*:subnet/*",
+                    "arn:aws:ec2:ap-south-1:*:security-group/*",
+                    "arn:aws:ec2:ap-south-1::image/ami-052cef05d01020f1d "
+                ],
+                "Condition": {
+                    "StringEquals": {
+                        "ec2:InstanceType": "t2.micro",
+                        "ec2:Region": "ap-south-1"
+                    }
                 }
-            }
-        },
-        {
-            "Effect": "Allow",
-            "Action": [
-                "ec2:DeleteVolume",
-                "ec2:DeleteTags"
-            ],
-            "Resource": [
-                "arn:aws:ec2:ap-south-1:*:volume/*",
-                "arn:aws:ec2:ap-south-1:*:network-interface/*",
-                "arn:aws:ec2:ap-south-1:*:instance/*",
-                "arn:aws:ec2:ap-south-1:*:subnet/*",
-                "arn:aws:ec2:ap-south-1:*:security-group/*",
-                "arn:aws:ec2:ap-south-1::image/ami-052cef05d01020f1d "
-            ],
-            "Condition": {
-                "StringEquals": {
-                    "ec2:Region": "ap-south-1"
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "ec2:DeleteVolume",
+                    "ec2:DeleteTags"
+                ],
+                "Resource": [
+                    "arn:aws:ec2:ap-south-1:*:volume/*",
+                    "arn:aws:ec2:ap-south-1:*:network-interface/*",
+                    "arn:aws:ec2:ap-south-1:*:instance/*",
+                    "arn:aws:ec2:ap-south-1:*:subnet/*",
+                    "arn:aws:ec2:ap-south-1:*:security-group/*",
+                    "arn:aws:ec2:ap-south-1::image/ami-052cef05d01020f1d "
+                ],
+                "Condition": {
+                    "StringEquals": {
+                        "ec2:Region": "ap-south-1"
+                    }
                 }
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "ec2:DescribeInstances",
+                    "ec2:DescribeNetworkInterfaces",
+                    "ec2:DescribeTags",
+                    "ec2:DescribeVpcs",
+                    "ec2:GetEbsEncryptionByDefault",
+                    "ec2:DescribeVolumesModifications",
+                    "ec2:GetEbsDefaultKmsKeyId",
+                    "ec2:DescribeSubnets",
+                    "ec2:DescribeKeyPairs",
+                    "ec2:DescribeInstanceStatus"
+                ],
+                "Resource": "*"
             }
-        },
-        {
-            "Effect": "Allow",
-            "Action": [
-                "ec2:DescribeInstances",
-                "ec2:DescribeNetworkInterfaces",
-                "ec2:DescribeTags",
-                "ec2:DescribeVpcs",
-                "ec2:GetEbsEncryptionByDefault",
-                "ec2:DescribeVolumesModifications",
-                "ec2:GetEbsDefaultKmsKeyId",
-                "ec2:DescribeSubnets",
-                "ec2:DescribeKeyPairs",
-                "ec2:DescribeInstanceStatus"
-            ],
-            "Resource": "*"
-        }
-    ]
-}
-rs = ex.attach_group_policy(group_name=groupname, inline_policy_name='RunEC2Instances',
-                            inline_policy_document=json.dumps(policy))
-print(rs)
+        ]
+    }
+    rs = ex.attach_group_policy(group_name=groupname, inline_policy_name='RunEC2Instances',
+                                inline_policy_document=json.dumps(policy))
+    print(rs)
+
+
+if __name__ == '__main__':
+    main()
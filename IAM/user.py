@@ -1,14 +1,14 @@
 import botocore
-import boto3
 import time
 import pprint
+from Common.clients import get_client
 
 
 class IAMUsers:
     def __init__(self, name='test') -> None:
 
-        # Initialize an IAM client
-        self.client = boto3.client('iam')
+        # The IAM client is shared, see Common.clients
+        self.client = get_client('iam')
         self.name = name
 
     def create_user(self, user_name):
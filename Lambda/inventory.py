@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import threading
+
+
+# Stored in the cache file, to be changed with anything changing the entries.
+CACHE_FORMAT = 2
+
+
+class DetailsCache(object):
+    """
+    The full configurations of Lambda function versions, kept in a JSON file
+    and keyed by the qualified function ARN. An entry is only valid for the
+    RevisionId it was fetched for, the revision changing with every update of
+    the code or configuration. Aliases and reserved concurrency don't change the
+    revision, they are never cached.
+    """
+
+    def __init__(self, filepath=None) -> None:
+        """
+        :param filepath: The cache file, defaults to
+                         ~/.cache/aws-automation/lambda-functions.json.
+        """
+        self.filepath = filepath or os.path.join(
+            os.path.expanduser('~'), '.cache', 'aws-automation', 'lambda-functions.json')
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.exists(self.filepath):
+            try:
+                with open(self.filepath) as f_ptr:
+                    data = json.load(f_ptr)
+            except ValueError:
+                print(f'Ignoring the corrupted cache {self.filepath}')
+            else:
+                # Entries of another format are dropped, they are fetched again.
+                if isinstance(data, dict) and data.get('Format') == CACHE_FORMAT:
+                    self.entries = data['Entries']
+
+    def get(self, arn, revision_id):
+        """
+        :return: The cached configuration, None when missing or of another revision.
+        """
+        with self._lock:
+            entry = self.entries.get(arn)
+            # Without a revision nothing tells whether the entry is still valid.
+            if entry is not None and revision_id and entry['RevisionId'] == revision_id:
+                self.hits += 1
+                return entry['Configuration']
+            self.misses += 1
+        return None
+
+    def set(self, arn, revision_id, configuration):
+        if not revision_id:
+            return
+        with self._lock:
+            self.entries[arn] = {'RevisionId': revision_id, 'Configuration': configuration}
+
+    def save(self, keep=None):
+        """
+        Writes the cache file.
+
+        :param keep: Only keep these ARNs, to drop the deleted functions.
+        """
+        with self._lock:
+            if keep is not None:
+                self.entries = {arn: entry for arn, entry in self.entries.items()
+                                if arn in keep}
+            directory = os.path.dirname(self.filepath) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f_ptr:
+                json.dump({'Format': CACHE_FORMAT, 'Entries': self.entries}, f_ptr,
+                          default=str)
+            os.replace(tmp_path, self.filepath)
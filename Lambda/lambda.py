@@ -1,21 +1,43 @@
 import io
-import boto3
 import json
 import time
-import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime as dt
+from datetime import timedelta
 from botocore.exceptions import ClientError
+from Common.clients import get_client, get_resource
+from Common.histogram import LatencyHistogram
+from Common.ratelimit import TokenBucket
+from Common.retry import Retrier, error_code, wait_until
+from Lambda.inventory import DetailsCache
+from Lambda.packaging import PackageCache, package_sha256, write_package
+from Lambda.upload import MultipartUploadWriter
+
+
+# PutTargets accepts at most 10 targets per call.
+PUT_TARGETS_LIMIT = 10
 
 
 class LambdaAPI(object):
 
-    def __init__(self, client) -> None:
-        self.client = client
+    def __init__(self, client=None) -> None:
+        """
+        :param client: The Boto3 Lambda client, defaults to the shared one.
+        """
+        self.client = client or get_client('lambda')
+
+    @property
+    def eventbridge_client(self):
+        """
+        The shared EventBridge client of the region of the Lambda client.
+        """
+        return get_client('events', region_name=self.client.meta.region_name)
 
     def exponential_retry(self, func, error_code, *func_args, **func_kwargs):
         """
-        Retries the specified function with a simple exponential backoff algorithm.
-        This is necessary when AWS is not yet ready to perform an action because all
-        resources have not been fully deployed.
+        Retries the specified function with decorrelated jitter backoff, see
+        Common.retry.Retrier. This is necessary when AWS is not yet ready to perform
+        an action because all resources have not been fully deployed.
 
         Credit: https://github.com/awsdocs/aws-doc-sdk-examples/blob/main/python/example_code/lambda/boto_client_examples/lambda_handler_basic.py
 
@@ -23,56 +45,162 @@ class LambdaAPI(object):
         :param error_code: The error code to retry. Other errors are raised again.
         :param func_args: The positional arguments to pass to the function.
         :param func_kwargs: The keyword arguments to pass to the function.
-        :return: The return value of the retried function.
+        :return: The return value of the retried function. The error is raised again
+                 when it still happens after about 90 seconds.
         """
-        sleepy_time = 1
-        func_return = None
-        while sleepy_time < 33 and func_return is None:
-            try:
-                func_return = func(*func_args, **func_kwargs)
-                print(f'Ran {func.__name__}, got {func_return}.')
-            except ClientError as error:
-                if error.response['Error']['Code'] == error_code:
-                    print(f'Sleeping for {sleepy_time} to give AWS time to connect resources.')
-                    time.sleep(sleepy_time)
-                    sleepy_time = sleepy_time*2
-                else:
-                    raise
+        retrier = Retrier({error_code: {}}, max_attempts=10, base=1.0, cap=32.0,
+                          deadline=90.0, name=getattr(func, '__name__', None))
+        func_return = retrier.call(func, *func_args, **func_kwargs)
+        print(f'Ran {retrier.name}, got {func_return} after {retrier.counters["retries"]} retries.')
         return func_return
 
+    def wait_until_active(self, function_name, timeout=300.0):
+        """
+        Waits until the function is Active and its last update is done, so it can
+        be invoked or updated again.
+
+        :return: The function configuration.
+        """
+        def active():
+            configuration = self.client.get_function_configuration(FunctionName=function_name)
+            if configuration.get('State', 'Active') == 'Failed':
+                raise RuntimeError(f"{function_name} failed: {configuration.get('StateReason')}")
+            if configuration.get('State', 'Active') == 'Active' and \
+                    configuration.get('LastUpdateStatus', 'Successful') != 'InProgress':
+                return configuration
+
+        return wait_until(active, timeout, interval=1.0, max_interval=10.0,
+                          ignore_codes=('ResourceNotFoundException',),
+                          description=f'{function_name} active')
+
+    def wait_until_invoked(self, function_name, since, timeout=600.0):
+        """
+        Waits until the function was invoked at least once since a date, according
+        to its Invocations metric.
+
+        :param since: A datetime (UTC).
+        :return: The number of invocations.
+        """
+        cloudwatch = get_client('cloudwatch', region_name=self.client.meta.region_name)
+
+        def invocations():
+            response = cloudwatch.get_metric_statistics(
+                Namespace='AWS/Lambda', MetricName='Invocations',
+                Dimensions=[{'Name': 'FunctionName', 'Value': function_name}],
+                StartTime=since - timedelta(minutes=1), EndTime=dt.utcnow() + timedelta(minutes=1),
+                Period=60, Statistics=['Sum'])
+            return int(sum(point['Sum'] for point in response['Datapoints']))
+
+        return wait_until(invocations, timeout, interval=15.0, max_interval=60.0,
+                          description=f'{function_name} invoked')
+
 
     def create_zip_package(self, func_file_name):
         """
-        Create a zip archive of the lambda function and also read the file as bytes
+        Create a zip archive of the lambda function and also read the file as bytes.
+        The archive is deterministic, see Lambda.packaging.
 
-        :param func_file_name: The name of the file containing lambda handler function
+        :param func_file_name: The name of the file containing lambda handler function,
+                               or a directory (or a list of them) to package.
         :return: return a byte representation of read file
         """
         try:
             buffer = io.BytesIO()
-            with zipfile.ZipFile(buffer, 'w') as ptr:
-                ptr.write(func_file_name)
-            buffer.seek(0)
-            return buffer.read()
+            write_package(func_file_name, buffer)
+            return buffer.getvalue()
         except Exception as e:
             print(e)
 
     def list_functions(self, **kwargs):
         """
         Returns a list of Lambda functions, with the version-specific configuration
-        of each. Lambda returns up to 50 functions per call.
+        of each. Every page of 50 functions is read, see iter_functions().
 
         :return: response containing every information of the functions
 
         """
         try:
-            response = self.client.list_functions(
-                FunctionVersion='ALL'
-            )
-            return response
+            return {'Functions': list(self.iter_functions(**kwargs))}
         except ClientError as e:
             print(e)
 
+    def _function_details(self, configuration, cache=None):
+        """
+        Fetches the full configuration of a function version, from the cache while
+        its RevisionId is unchanged, and for $LATEST the reserved concurrency and the
+        aliases of the function. Those two are fetched every time: changing them
+        doesn't change the RevisionId of the configuration.
+
+        :return: The qualified ARN of the version and its details.
+        """
+        name, version = configuration['FunctionName'], configuration['Version']
+        arn = configuration['FunctionArn']
+        if version != '$LATEST' and not arn.endswith(f':{version}'):
+            arn = f'{arn}:{version}'
+        revision_id = configuration.get('RevisionId')
+        full_configuration = cache.get(arn, revision_id) if cache else None
+        if full_configuration is None:
+            full_configuration = self.client.get_function_configuration(
+                FunctionName=name, Qualifier=version)
+            full_configuration.pop('ResponseMetadata', None)
+            if cache:
+                cache.set(arn, revision_id, full_configuration)
+        details = {'Configuration': full_configuration}
+        if version == '$LATEST':
+            concurrency = self.client.get_function_concurrency(FunctionName=name)
+            details['ReservedConcurrentExecutions'] = \
+                concurrency.get('ReservedConcurrentExecutions')
+            details['Aliases'] = [
+                alias for page in self.client.get_paginator('list_aliases').paginate(
+                    FunctionName=name)
+                for alias in page['Aliases']
+            ]
+        return arn, details
+
+    def iter_functions(self, function_version='ALL', details=False, workers=8, cache=None):
+        """
+        Yields every function (and every version with 'ALL') of the region,
+        following the pagination of list_functions.
+
+        With details, the full configuration, concurrency and aliases of every
+        function are fetched by a thread pool and added under 'Details'. Full
+        configurations are cached on disk by RevisionId, so only the functions
+        which changed since the last run are fetched again.
+
+        :param function_version: 'ALL' for every version, None for $LATEST only.
+        :param details: Fetch the details of every function.
+        :param workers: Number of concurrent detail fetches.
+        :param cache: The DetailsCache, defaults to the one in ~/.cache, False disables it.
+        :return: A generator of function configurations.
+        """
+        kwargs = {'FunctionVersion': function_version} if function_version else {}
+        pages = self.client.get_paginator('list_functions').paginate(**kwargs)
+        if not details:
+            for page in pages:
+                yield from page['Functions']
+            return
+
+        if cache is None:
+            cache = DetailsCache()
+        seen = set()
+        completed = False
+
+        def with_details(configuration):
+            arn, function_details = self._function_details(configuration, cache)
+            seen.add(arn)
+            return dict(configuration, Details=function_details)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for page in pages:
+                    yield from executor.map(with_details, page['Functions'])
+            completed = True
+        finally:
+            if cache:
+                # Deleted functions are only dropped after a complete listing.
+                cache.save(keep=seen if completed else None)
+                print(f'Function configurations: {cache.hits} cached, {cache.misses} fetched.')
+
     def create_iam_role_for_lambda(self, iam_resource, iam_role_name):
         """
         Creates an AWS Identity and Access Management (IAM) role that grants the
@@ -152,6 +280,125 @@ class LambdaAPI(object):
 
         except ClientError as e:
             print(e)
+            raise
+
+    def deploy_package(self, function_name, sources, handler_name=None, iam_role=None,
+                       description='', runtime='python3.9', cache=None, publish=True):
+        """
+        Creates the function, or updates its code only when it changed. The package
+        is built (or taken from the cache) and its CodeSha256 compared with the
+        deployed one, so deploying unchanged sources costs a single API call.
+
+        :param function_name: The name of the AWS Lambda function.
+        :param sources: The file or directory (or a list of them) to package.
+        :param handler_name: The handler, only needed to create the function.
+        :param iam_role: The IAM role, only needed to create the function.
+        :param description: The description, used when creating the function.
+        :param runtime: The runtime, used when creating the function.
+        :param cache: The PackageCache, defaults to the one in ~/.cache.
+        :param publish: Publish a version on create and update.
+        :return: A dict with the 'function_arn', the 'code_sha256' and the
+                 'action' taken: 'create', 'update' or 'skip'.
+        """
+        zip_path, sha = (cache or PackageCache()).build(sources)
+        try:
+            configuration = self.client.get_function_configuration(FunctionName=function_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            configuration = None
+
+        if configuration is not None and configuration['CodeSha256'] == sha:
+            print(f'{function_name} is up to date ({sha}).')
+            return {'function_arn': configuration['FunctionArn'], 'code_sha256': sha,
+                    'action': 'skip'}
+
+        with open(zip_path, 'rb') as zip_file:
+            if configuration is None:
+                response = self.client.create_function(
+                    FunctionName=function_name,
+                    Description=description,
+                    Runtime=runtime,
+                    Role=iam_role.arn if hasattr(iam_role, 'arn') else iam_role,
+                    Handler=handler_name,
+                    Code={'ZipFile': zip_file.read()},
+                    Publish=publish
+                )
+                action = 'create'
+            else:
+                response = self.client.update_function_code(
+                    FunctionName=function_name,
+                    ZipFile=zip_file.read(),
+                    Publish=publish
+                )
+                action = 'update'
+        print(f"{action.capitalize()}d function '{function_name}' ({sha}).")
+        return {'function_arn': response['FunctionArn'], 'code_sha256': sha, 'action': action}
+
+    def deploy_package_s3(self, function_name, sources, bucket, key=None, handler_name=None,
+                          iam_role=None, description='', runtime='python3.9', publish=True,
+                          part_size=8 * 1024 * 1024, workers=4, s3_client=None):
+        """
+        Deploys a package of any size through S3. The CodeSha256 of the package is
+        computed first and compared with the deployed one, nothing is uploaded when
+        they are the same. Otherwise the package is zipped straight into a
+        multipart upload, parts being uploaded while the next ones are built, then
+        the function is created or updated from the S3 object.
+
+        :param function_name: The name of the AWS Lambda function.
+        :param sources: The file or directory (or a list of them) to package.
+        :param bucket: The S3 bucket, in the region of the function.
+        :param key: The object key, defaults to '<function name>.zip'.
+        :param part_size: Size of the upload parts, at least 5 MiB.
+        :param workers: Number of parts uploaded concurrently.
+        :param s3_client: The Boto3 S3 client, defaults to the shared one of the
+                          region of the Lambda client.
+        :return: A dict like deploy_package() with the 'bucket' and 'key'.
+
+        The other arguments are those of deploy_package().
+        """
+        key = key or f'{function_name}.zip'
+        sha = package_sha256(sources)
+        try:
+            configuration = self.client.get_function_configuration(FunctionName=function_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            configuration = None
+
+        result = {'code_sha256': sha, 'bucket': bucket, 'key': key}
+        if configuration is not None and configuration['CodeSha256'] == sha:
+            print(f'{function_name} is up to date ({sha}).')
+            result.update(function_arn=configuration['FunctionArn'], action='skip')
+            return result
+
+        s3 = s3_client or get_client('s3', region_name=self.client.meta.region_name)
+        start = time.monotonic()
+        with MultipartUploadWriter(s3, bucket, key, part_size, workers) as writer:
+            write_package(sources, writer)
+        if writer.code_sha256() != sha:
+            raise RuntimeError(f'The sources changed while {function_name} was packaged.')
+        print(f'Uploaded s3://{bucket}/{key} ({writer.size} bytes) in '
+              f'{time.monotonic() - start:.1f}s.')
+
+        if configuration is None:
+            response = self.client.create_function(
+                FunctionName=function_name,
+                Description=description,
+                Runtime=runtime,
+                Role=iam_role.arn if hasattr(iam_role, 'arn') else iam_role,
+                Handler=handler_name,
+                Code={'S3Bucket': bucket, 'S3Key': key},
+                Publish=publish
+            )
+            result['action'] = 'create'
+        else:
+            response = self.client.update_function_code(
+                FunctionName=function_name, S3Bucket=bucket, S3Key=key, Publish=publish)
+            result['action'] = 'update'
+        print(f"{result['action'].capitalize()}d function '{function_name}' ({sha}).")
+        result['function_arn'] = response['FunctionArn']
+        return result
 
     def delete_lambda_function(self, function_name):
         """
@@ -184,6 +431,118 @@ class LambdaAPI(object):
             print(f'Could not invoke function {function_name}.')
             raise
 
+    def _invoke_one(self, function_name, payload, invocation_type, qualifier, max_retries):
+        """
+        Invokes the function once, retrying throttled calls with a Retrier.
+
+        :return: A dict with the 'status_code', the 'function_error', the
+                 decoded 'payload' or the 'error', the 'retries', the 'seconds' of
+                 the last attempt and the 'total_seconds' including the retries
+                 and their backoff.
+        """
+        kwargs = {'FunctionName': function_name, 'InvocationType': invocation_type,
+                  'Payload': payload if isinstance(payload, (bytes, str)) else json.dumps(payload)}
+        if qualifier:
+            kwargs['Qualifier'] = qualifier
+        result = {'status_code': None, 'function_error': None, 'payload': None,
+                  'error': None, 'retries': 0}
+        retrier = Retrier(('TooManyRequestsException',), max_attempts=max_retries + 1,
+                          base=0.1, cap=10.0, name='invoke')
+        # Start of every attempt, the backoff between attempts is not latency.
+        attempts = []
+
+        def invoke():
+            attempts.append(time.monotonic())
+            return self.client.invoke(**kwargs)
+
+        start = time.monotonic()
+        try:
+            response = retrier.call(invoke)
+            result['status_code'] = response['StatusCode']
+            result['function_error'] = response.get('FunctionError')
+            body = response['Payload'].read() if 'Payload' in response else b''
+        except Exception as e:
+            # Timeouts and connection errors fail this payload, not the batch.
+            result['error'] = error_code(e) or type(e).__name__
+            body = b''
+        result['retries'] = max(0, len(attempts) - 1)
+        if body:
+            try:
+                result['payload'] = json.loads(body)
+            except ValueError:
+                result['payload'] = body.decode(errors='replace')
+        result['seconds'] = time.monotonic() - (attempts[-1] if attempts else start)
+        result['total_seconds'] = time.monotonic() - start
+        return result
+
+    def invoke_many(self, function_name, payloads, invocation_type='RequestResponse',
+                    workers=16, max_retries=6, qualifier=None, keep_results=True):
+        """
+        Invokes a function once per payload with at most `workers` invocations in
+        flight. Payloads are read from the iterable as slots free up, so a
+        generator of millions of payloads is fine.
+
+        :param function_name: The name of the function to invoke.
+        :param payloads: An iterable of payloads, dicts are serialized to JSON.
+        :param invocation_type: 'RequestResponse', or 'Event' to only queue the
+                                invocations without waiting for their result.
+        :param workers: Maximum number of concurrent invocations.
+        :param max_retries: Retries of a throttled invocation.
+        :param qualifier: A version or alias to invoke.
+        :param keep_results: Keep the result of every invocation, by payload order.
+        :return: A dict with the counts of 'invocations', 'succeeded',
+                 'function_errors', 'failed' and 'retries', the 'status_codes',
+                 the 'latency' summary of the invocations (the last attempt of
+                 each, without the retries), the 'retry_seconds' spent in failed
+                 attempts and backoff and, if kept, the 'results'.
+        """
+        histogram = LatencyHistogram()
+        report = {'invocations': 0, 'succeeded': 0, 'function_errors': 0, 'failed': 0,
+                  'retries': 0, 'retry_seconds': 0.0, 'status_codes': {}}
+        results = {}
+
+        def collect(index, result):
+            histogram.record(result['seconds'])
+            report['retries'] += result['retries']
+            report['retry_seconds'] += result['total_seconds'] - result['seconds']
+            if result['error']:
+                report['failed'] += 1
+            elif result['function_error']:
+                report['function_errors'] += 1
+            else:
+                report['succeeded'] += 1
+            if result['status_code'] is not None:
+                codes = report['status_codes']
+                codes[result['status_code']] = codes.get(result['status_code'], 0) + 1
+            if keep_results:
+                results[index] = result
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            for index, payload in enumerate(payloads):
+                if len(pending) >= workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(pending.pop(future), future.result())
+                future = executor.submit(self._invoke_one, function_name, payload,
+                                         invocation_type, qualifier, max_retries)
+                pending[future] = index
+                report['invocations'] += 1
+            for future in wait(pending).done:
+                collect(pending[future], future.result())
+
+        report['seconds'] = time.monotonic() - start
+        report['latency'] = histogram.summary()
+        if keep_results:
+            report['results'] = [results[index] for index in range(report['invocations'])]
+        print(f"Invoked {function_name} {report['invocations']} times in "
+              f"{report['seconds']:.1f}s: {report['succeeded']} succeeded, "
+              f"{report['function_errors']} function errors, {report['failed']} failed, "
+              f"{report['retries']} retries ({report['retry_seconds']:.1f}s). "
+              f"Latency {histogram.report()}")
+        return report
+
     def schedule_lambda_function(
         self, event_rule_name, event_schedule, lambda_function_name, lambda_function_arn):
         """
@@ -197,7 +556,7 @@ class LambdaAPI(object):
         :param lambda_function_arn: The Amazon Resource Name (ARN) of the function.
         :return: The ARN of the EventBridge rule.
         """
-        eventbridge_client = boto3.client('events')
+        eventbridge_client = self.eventbridge_client
         try:
             response = eventbridge_client.put_rule(
                 Name=event_rule_name, ScheduleExpression=event_schedule)
@@ -234,6 +593,192 @@ class LambdaAPI(object):
         return event_rule_arn
 
 
+    def _read_schedule_state(self, rule_names, function_names, workers):
+        """
+        Reads the existing rules, their targets and the resource policies of the
+        functions, every list or get call being made once.
+
+        :return: The rules by name, the targets by rule name, the EventBridge
+                 rule ARNs allowed by every function and the ARNs of the functions.
+        """
+        events = self.eventbridge_client
+        rules = {rule['Name']: rule
+                 for page in events.get_paginator('list_rules').paginate()
+                 for rule in page['Rules'] if rule['Name'] in rule_names}
+        function_arns = {function['FunctionName']: function['FunctionArn']
+                         for function in self.iter_functions(function_version=None)
+                         if function['FunctionName'] in function_names}
+
+        def targets(rule_name):
+            paginator = events.get_paginator('list_targets_by_rule')
+            return {target['Id']: target for page in paginator.paginate(Rule=rule_name)
+                    for target in page['Targets']}
+
+        def allowed_sources(function_name):
+            try:
+                policy = json.loads(self.client.get_policy(FunctionName=function_name)['Policy'])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                    raise
+                return set()
+            sources = set()
+            for statement in policy.get('Statement', []):
+                principal = statement.get('Principal', {})
+                if isinstance(principal, dict):
+                    principal = principal.get('Service')
+                if principal != 'events.amazonaws.com' or statement.get('Effect') != 'Allow':
+                    continue
+                condition = statement.get('Condition', {}).get('ArnLike', {})
+                sources.add(condition.get('AWS:SourceArn'))
+            return sources
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            existing_rules = sorted(rules)
+            rule_targets = dict(zip(existing_rules, executor.map(targets, existing_rules)))
+            names = sorted(function_arns)
+            permissions = dict(zip(names, executor.map(allowed_sources, names)))
+        return rules, rule_targets, permissions, function_arns
+
+    def _statement_source(self, function_name, statement_id):
+        """
+        Returns the SourceArn of a statement of the function policy, '' when it has
+        none and None when there is no such statement.
+        """
+        try:
+            policy = json.loads(self.client.get_policy(FunctionName=function_name)['Policy'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            return None
+        for statement in policy.get('Statement', []):
+            if statement.get('Sid') == statement_id:
+                return statement.get('Condition', {}).get('ArnLike', {}).get('AWS:SourceArn', '')
+        return None
+
+    def schedule_lambda_functions(self, specs, workers=8, permissions_per_second=5.0,
+                                  dry_run=False):
+        """
+        Schedules many functions with EventBridge, only creating what is missing.
+        The rules, targets and function policies are read once, then missing or
+        changed rules are put, the missing permissions are added concurrently under
+        a rate limit, and the missing targets are put 10 per call. Running it again
+        with the same specs makes no mutating call.
+
+        :param specs: An iterable of (rule name, schedule expression, function name).
+        :param workers: Number of concurrent calls.
+        :param permissions_per_second: Rate limit of the add_permission calls.
+        :param dry_run: Only return what would be done.
+        :return: A dict with the 'rules', 'permissions' and 'targets' created, the
+                 number of mutating 'calls' and the 'errors'.
+        """
+        specs = [tuple(spec) for spec in specs]
+        report = {'rules': [], 'permissions': [], 'targets': [], 'calls': 0, 'errors': []}
+        rules, rule_targets, permissions, function_arns = self._read_schedule_state(
+            {rule for rule, _, _ in specs}, {function for _, _, function in specs}, workers)
+
+        schedules = {}
+        for rule_name, schedule, function_name in specs:
+            if function_name not in function_arns:
+                report['errors'].append((rule_name, function_name, 'ResourceNotFoundException'))
+            elif schedules.setdefault(rule_name, schedule) != schedule:
+                report['errors'].append((rule_name, function_name, 'ConflictingSchedule'))
+        specs = [spec for spec in specs
+                 if spec[2] in function_arns and schedules[spec[0]] == spec[1]]
+
+        events = self.eventbridge_client
+        rule_arns = {name: rule['Arn'] for name, rule in rules.items()}
+        changed_rules = sorted(
+            name for name, schedule in schedules.items()
+            if name not in rules or rules[name].get('ScheduleExpression') != schedule
+            or rules[name].get('State') != 'ENABLED')
+        report['rules'] = changed_rules
+        if not dry_run:
+            def put_rule(name):
+                return events.put_rule(Name=name, ScheduleExpression=schedules[name],
+                                       State='ENABLED')['RuleArn']
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                rule_arns.update(zip(changed_rules, executor.map(put_rule, changed_rules)))
+            report['calls'] += len(changed_rules)
+        for name in changed_rules:
+            # Not created in a dry run, a placeholder ARN stands for the new rule.
+            rule_arns.setdefault(name, f'arn:aws:events:::rule/{name}')
+
+        missing_permissions = {}
+        for rule_name, _, function_name in specs:
+            if rule_arns[rule_name] not in permissions[function_name]:
+                missing_permissions.setdefault(function_name, []).append(rule_name)
+                permissions[function_name].add(rule_arns[rule_name])
+        report['permissions'] = [(rule_name, function_name)
+                                 for function_name, rule_names in sorted(missing_permissions.items())
+                                 for rule_name in rule_names]
+        if not dry_run and missing_permissions:
+            bucket = TokenBucket(permissions_per_second)
+
+            def add_permissions(function_name):
+                # A function policy takes one change at a time, the permissions of a
+                # function are added in series and different functions concurrently.
+                errors, calls = [], 0
+                for rule_name in missing_permissions[function_name]:
+                    kwargs = dict(FunctionName=function_name,
+                                  StatementId=f'{rule_name}-invoke'[:100],
+                                  Action='lambda:InvokeFunction',
+                                  Principal='events.amazonaws.com',
+                                  SourceArn=rule_arns[rule_name])
+                    try:
+                        bucket.acquire()
+                        calls += 1
+                        try:
+                            self.client.add_permission(**kwargs)
+                        except ClientError as e:
+                            if e.response['Error']['Code'] != 'ResourceConflictException':
+                                raise
+                            # The statement may exist for another rule ARN, e.g. of a
+                            # deleted rule, and would not let this rule invoke.
+                            source = self._statement_source(function_name, kwargs['StatementId'])
+                            if source == kwargs['SourceArn']:
+                                continue
+                            if source is not None:
+                                bucket.acquire()
+                                calls += 1
+                                self.client.remove_permission(
+                                    FunctionName=function_name, StatementId=kwargs['StatementId'])
+                            bucket.acquire()
+                            calls += 1
+                            self.client.add_permission(**kwargs)
+                    except ClientError as e:
+                        errors.append((rule_name, function_name, e.response['Error']['Code']))
+                return errors, calls
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for errors, calls in executor.map(add_permissions, sorted(missing_permissions)):
+                    report['errors'].extend(errors)
+                    report['calls'] += calls
+
+        missing_targets = {}
+        for rule_name, _, function_name in specs:
+            target = rule_targets.get(rule_name, {}).get(function_name)
+            if target is None or target['Arn'] != function_arns[function_name]:
+                missing_targets.setdefault(rule_name, []).append(
+                    {'Id': function_name, 'Arn': function_arns[function_name]})
+        report['targets'] = [(rule_name, target['Id'])
+                             for rule_name, targets in sorted(missing_targets.items())
+                             for target in targets]
+        if not dry_run:
+            for rule_name, targets in sorted(missing_targets.items()):
+                for idx in range(0, len(targets), PUT_TARGETS_LIMIT):
+                    response = events.put_targets(
+                        Rule=rule_name, Targets=targets[idx:idx + PUT_TARGETS_LIMIT])
+                    report['calls'] += 1
+                    for entry in response.get('FailedEntries', []):
+                        report['errors'].append((rule_name, entry['TargetId'], entry['ErrorCode']))
+
+        print(f"{'Would schedule' if dry_run else 'Scheduled'} {len(specs)} functions: "
+              f"{len(report['rules'])} rules, {len(report['permissions'])} permissions, "
+              f"{len(report['targets'])} targets, {report['calls']} calls, "
+              f"{len(report['errors'])} errors.")
+        return report
+
     def update_event_rule(self, event_rule_name, enable):
         """
         Updates the schedule event rule by enabling or disabling it.
@@ -242,7 +787,7 @@ class LambdaAPI(object):
         :param enable: When True, the rule is enabled. Otherwise, it is disabled.
         """
         try:
-            eventbridge_client = boto3.client('events')
+            eventbridge_client = self.eventbridge_client
             if enable:
                 eventbridge_client.enable_rule(Name=event_rule_name)
             else:
@@ -261,7 +806,7 @@ class LambdaAPI(object):
         :return: True when the rule is enabled. Otherwise, False.
         """
         try:
-            eventbridge_client = boto3.client('events')
+            eventbridge_client = self.eventbridge_client
             response = eventbridge_client.describe_rule(Name=event_rule_name)
             enabled = response['State'] == 'ENABLED'
             print(f'{event_rule_name} is {enabled}.')
@@ -281,7 +826,7 @@ class LambdaAPI(object):
                                     as a target.
         """
         try:
-            eventbridge_client = boto3.client('events')
+            eventbridge_client = self.eventbridge_client
             eventbridge_client.remove_targets(
                 Rule=event_rule_name, Ids=[lambda_function_name])
             eventbridge_client.delete_rule(Name=event_rule_name)
@@ -291,48 +836,60 @@ class LambdaAPI(object):
             raise
 
 
-client = boto3.client('lambda')
-iam_resource = boto3.resource('iam')
+def main():
+    """
+    Demo: deploys a Lambda function stopping the EC2 instances, schedules it
+    with EventBridge, lets it trigger once and cleans everything up.
+    """
+    client = get_client('lambda')
+    iam_resource = get_resource('iam')
+
+    l = LambdaAPI(client=client)
+
+    lambda_function_filename = 'lambda_handler_scheduled.py'
+    lambda_handler_name = 'lambda_handler_scheduled.lambda_handler'
+    lambda_role_name = 'demo-lambda-role'
+    lambda_function_name = 'demo-lambda-scheduled'
+    event_rule_name = 'demo-event-scheduled'
+    event_schedule = 'rate(1 minute)'
+
 
-l = LambdaAPI(client=client)
+    print(f"Creating AWS Lambda function {lambda_function_name} from the "
+            f"{lambda_handler_name} function in {lambda_function_filename}...")
+    deployment_package = l.create_zip_package(lambda_function_filename)
+    iam_role = l.create_iam_role_for_lambda(iam_resource, lambda_role_name)
+    lambda_function_arn = l.exponential_retry(
+        l.deploy_lambda_function, 'InvalidParameterValueException',
+        lambda_function_name, 'Demo Lambda to Stop EC2 instance', lambda_handler_name, iam_role,
+        deployment_package
+    )
 
-lambda_function_filename = 'lambda_handler_scheduled.py'
-lambda_handler_name = 'lambda_handler_scheduled.lambda_handler'
-lambda_role_name = 'demo-lambda-role'
-lambda_function_name = 'demo-lambda-scheduled'
-event_rule_name = 'demo-event-scheduled'
-event_schedule = 'cron(38 11 * * ? *)'
+    l.wait_until_active(lambda_function_name)
 
+    print(f"Scheduling {lambda_function_name} to run as per cron job")
+    scheduled_at = dt.utcnow()
+    l.schedule_lambda_function(
+        event_rule_name, event_schedule,
+        lambda_function_name, lambda_function_arn
+    )
 
-print(f"Creating AWS Lambda function {lambda_function_name} from the "
-        f"{lambda_handler_name} function in {lambda_function_filename}...")
-deployment_package = l.create_zip_package(lambda_function_filename)
-iam_role = l.create_iam_role_for_lambda(iam_resource, lambda_role_name)
-lambda_function_arn = l.exponential_retry(
-    l.deploy_lambda_function, 'InvalidParameterValueException',
-    lambda_function_name, 'Demo Lambda to Stop EC2 instance', lambda_handler_name, iam_role,
-    deployment_package
-)
+    print(f"Waiting for our function to trigger...")
+    l.wait_until_invoked(lambda_function_name, scheduled_at)
 
-print(f"Scheduling {lambda_function_name} to run as per cron job")
-l.schedule_lambda_function(
-    event_rule_name, event_schedule,
-    lambda_function_name, lambda_function_arn
-)
+    print(f"Disabling event {event_rule_name}...")
+    l.update_event_rule(event_rule_name, False)
+    l.get_event_rule_enabled(event_rule_name)
 
-print(f"Sleeping for 3 minutes to let our function trigger...")
-time.sleep(3*60)
+    print("Cleaning up all resources created for the demo...")
+    l.delete_event_rule(event_rule_name, lambda_function_name)
+    l.delete_lambda_function(lambda_function_name)
+    print(f"Deleted {lambda_function_name}.")
 
-print(f"Disabling event {event_rule_name}...")
-l.update_event_rule(event_rule_name, False)
-l.get_event_rule_enabled(event_rule_name)
+    for policy in iam_role.attached_policies.all():
+        policy.detach_role(RoleName=iam_role.name)
+    iam_role.delete()
+    print(f"Deleted {iam_role.name}.")
 
-print("Cleaning up all resources created for the demo...")
-l.delete_event_rule(event_rule_name, lambda_function_name)
-l.delete_lambda_function(lambda_function_name)
-print(f"Deleted {lambda_function_name}.")
 
-for policy in iam_role.attached_policies.all():
-    policy.detach_role(RoleName=iam_role.name)
-iam_role.delete()
-print(f"Deleted {iam_role.name}.")
+if __name__ == '__main__':
+    main()
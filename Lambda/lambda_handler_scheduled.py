@@ -1,27 +1,117 @@
 import boto3
+import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-client = boto3.client('ec2')
+# stop_instances accepts at most 1000 instance IDs per call.
+STOP_IDS_LIMIT = 1000
+# describe_instances returns at most 1000 instances per page.
+DESCRIBE_PAGE_SIZE = 1000
+WORKERS = int(os.environ.get('STOP_WORKERS', '8'))
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ScheduledStop')
 
-def lambda_handler(event, context):
-    logger.info(f'Event occured {event}')
+# Created on the first invocation and reused by the warm ones.
+client = None
+
+
+def get_ec2_client():
+    global client
+    if client is None:
+        client = boto3.client('ec2')
+    return client
 
+
+def tag_filters(event):
+    """
+    Reads the tags the instances must have from the event, or else from the
+    STOP_TAGS environment variable, both like {"env": ["dev", "test"]}.
+    """
+    tags = (event or {}).get('tags')
+    if tags is None:
+        tags = json.loads(os.environ.get('STOP_TAGS') or '{}')
+    return [{'Name': f'tag:{key}', 'Values': values if isinstance(values, list) else [values]}
+            for key, values in tags.items()]
+
+
+def running_instance_ids(ec2, filters):
+    """
+    Returns the IDs of every running instance matching the filters, the state
+    and tags are filtered server side.
+    """
     instance_ids = []
+    paginator = ec2.get_paginator('describe_instances')
+    pages = paginator.paginate(
+        Filters=[{'Name': 'instance-state-name', 'Values': ['running']}] + filters,
+        PaginationConfig={'PageSize': DESCRIBE_PAGE_SIZE}
+    )
+    for page in pages:
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                instance_ids.append(instance['InstanceId'])
+    return instance_ids
+
 
+def stop_chunk(ec2, instance_ids):
     try:
-        instance_id = client.describe_instances(
-            )['Reservations']
-        for idx in instance_id:
-            instance_ids.append(idx['Instances'][0]['InstanceId'])
-
-        response = client.stop_instances(
-            InstanceIds=instance_ids,
-                DryRun=False
-            )
-        print(f'Stopped the instances - "{instance_ids}"')
+        response = ec2.stop_instances(InstanceIds=instance_ids, DryRun=False)
+        return len(response['StoppingInstances']), None
     except Exception as e:
+        logger.error(f'Error occured stopping {len(instance_ids)} instances: {e}')
+        return 0, e
+
+
+def emit_metrics(found, stopped, failed, duration_ms):
+    """
+    Writes the metrics of the run in Embedded Metric Format, CloudWatch extracts
+    them from the logs without any API call.
+    """
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [[]],
+                'Metrics': [
+                    {'Name': 'InstancesFound', 'Unit': 'Count'},
+                    {'Name': 'InstancesStopped', 'Unit': 'Count'},
+                    {'Name': 'InstancesFailed', 'Unit': 'Count'},
+                    {'Name': 'Duration', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        'InstancesFound': found,
+        'InstancesStopped': stopped,
+        'InstancesFailed': failed,
+        'Duration': duration_ms
+    }))
+
+
+def lambda_handler(event, context):
+    logger.info(f'Event occured {event}')
+    start = time.monotonic()
+    ec2 = get_ec2_client()
+
+    instance_ids = running_instance_ids(ec2, tag_filters(event))
+    chunks = [instance_ids[idx:idx + STOP_IDS_LIMIT]
+              for idx in range(0, len(instance_ids), STOP_IDS_LIMIT)]
+    stopped, errors = 0, []
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(WORKERS, len(chunks))) as executor:
+            for count, error in executor.map(lambda chunk: stop_chunk(ec2, chunk), chunks):
+                stopped += count
+                if error is not None:
+                    errors.append(error)
+
+    failed = len(instance_ids) - stopped
+    emit_metrics(len(instance_ids), stopped, failed,
+                 round((time.monotonic() - start) * 1000, 1))
+    print(f'Stopped {stopped} of {len(instance_ids)} running instances.')
+    if errors:
         print('Error occured during stopping instances.')
-        raise
+        raise errors[0]
+    return {'found': len(instance_ids), 'stopped': stopped}
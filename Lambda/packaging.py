@@ -0,0 +1,184 @@
+"""
+Deterministic Lambda deployment packages.
+
+The same sources always give the same zip bytes, so the CodeSha256 Lambda
+reports for a deployed function tells whether the code changed. Entries are
+sorted, timestamps are fixed to 1980-01-01 and permissions to 0644 (0755 for
+executables). Files are streamed into the archive, the package is never held
+in memory.
+"""
+import base64
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import zipfile
+
+
+# Oldest date a zip entry can hold.
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+CHUNK_SIZE = 1024 * 1024
+# Part of the cache key, to be changed with anything changing the zip bytes.
+PACKAGE_FORMAT = b'lambda-package-2'
+EXCLUDED_DIRS = ('__pycache__', '.git')
+EXCLUDED_SUFFIXES = ('.pyc',)
+
+
+def package_entries(paths):
+    """
+    Lists the files of a package. A file is added at the root of the archive
+    and the content of a directory is added relative to the directory.
+
+    :param paths: A path or a list of paths of files and directories.
+    :return: A list of (archive name, file path, mode) sorted by archive name.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    entries = {}
+
+    def add(arcname, filepath):
+        if arcname in entries:
+            raise ValueError(f'{arcname} is in the package twice: {entries[arcname][1]} '
+                             f'and {filepath}')
+        executable = os.stat(filepath).st_mode & stat.S_IXUSR
+        entries[arcname] = (arcname, filepath, 0o755 if executable else 0o644)
+
+    for path in paths:
+        if not os.path.isdir(path):
+            add(os.path.basename(path), path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [name for name in dirnames if name not in EXCLUDED_DIRS]
+            for filename in filenames:
+                if filename.endswith(EXCLUDED_SUFFIXES):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                add(os.path.relpath(filepath, path).replace(os.sep, '/'), filepath)
+    return [entries[arcname] for arcname in sorted(entries)]
+
+
+class _Stream(object):
+    """
+    Hides the seek() of a file object: zipfile lays out the archive differently
+    when it can seek back, and the bytes must not depend on the destination.
+    """
+
+    def __init__(self, fileobj) -> None:
+        self.fileobj = fileobj
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+def write_package(paths, fileobj):
+    """
+    Streams the zip archive of the sources to a file object, which does not
+    need to be seekable.
+    """
+    with zipfile.ZipFile(_Stream(fileobj), 'w', zipfile.ZIP_DEFLATED) as archive:
+        for arcname, filepath, mode in package_entries(paths):
+            info = zipfile.ZipInfo(arcname, date_time=ZIP_EPOCH)
+            info.create_system = 3
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(filepath, 'rb') as src, archive.open(info, 'w') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class _HashSink(object):
+    """
+    A file object hashing what is written to it, nothing is kept.
+    """
+
+    def __init__(self) -> None:
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def package_sha256(paths):
+    """
+    Returns the CodeSha256 the package of the sources will have, without
+    writing the package anywhere.
+    """
+    sink = _HashSink()
+    write_package(paths, sink)
+    return base64.b64encode(sink.sha256.digest()).decode()
+
+
+def sources_hash(paths):
+    """
+    Hashes the names, modes and contents of the sources, a cheap key of the
+    package which doesn't need the package to be built.
+    """
+    digest = hashlib.sha256(PACKAGE_FORMAT)
+    for arcname, filepath, mode in package_entries(paths):
+        digest.update(f'\0{arcname}\0{mode:o}\0'.encode())
+        with open(filepath, 'rb') as f_ptr:
+            for chunk in iter(lambda: f_ptr.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_sha256(filepath):
+    """
+    Returns the hash of a package the way Lambda reports it in CodeSha256.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f_ptr:
+        for chunk in iter(lambda: f_ptr.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode()
+
+
+class PackageCache(object):
+    """
+    Built packages on disk, keyed by the hash of their sources, so unchanged
+    sources are never zipped again.
+    """
+
+    def __init__(self, directory=None) -> None:
+        """
+        :param directory: Where the packages are kept, defaults to
+                          ~/.cache/aws-automation/lambda.
+        """
+        self.directory = directory or os.path.join(
+            os.path.expanduser('~'), '.cache', 'aws-automation', 'lambda')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def build(self, paths):
+        """
+        Returns the package of the sources, building it when not cached.
+
+        :return: The path of the zip file and its CodeSha256.
+        """
+        key = sources_hash(paths)
+        zip_path = os.path.join(self.directory, f'{key}.zip')
+        sha_path = os.path.join(self.directory, f'{key}.sha256')
+        if os.path.exists(zip_path) and os.path.exists(sha_path):
+            with open(sha_path) as f_ptr:
+                return zip_path, f_ptr.read().strip()
+
+        # Written aside and renamed, so a concurrent or failed build never
+        # leaves a partial package in the cache.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f_ptr:
+                write_package(paths, f_ptr)
+            sha = code_sha256(tmp_path)
+            os.replace(tmp_path, zip_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with open(sha_path, 'w') as f_ptr:
+            f_ptr.write(sha)
+        return zip_path, sha
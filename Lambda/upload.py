@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# S3 parts are at least 5 MiB, except the last one, and at most 10000.
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class MultipartUploadWriter(object):
+    """
+    A write only, non seekable file object uploading what is written to S3 as
+    a multipart upload. Every full part is sent by a thread pool while the
+    writer keeps producing the next ones, at most max_pending parts are held
+    in memory and write() blocks beyond.
+
+        with MultipartUploadWriter(s3_client, 'bucket', 'key.zip') as writer:
+            write_package('src', writer)
+
+    The upload is completed on close, or aborted when the block raises.
+    """
+
+    def __init__(self, client, bucket, key, part_size=8 * 1024 * 1024, workers=4,
+                 max_pending=None) -> None:
+        """
+        :param client: The Boto3 S3 client.
+        :param bucket: The bucket name.
+        :param key: The object key.
+        :param part_size: Size of the parts, at least 5 MiB.
+        :param workers: Number of parts uploaded concurrently.
+        :param max_pending: Parts buffered or uploading, defaults to twice the workers.
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes.')
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.closed = False
+        self._buffer = bytearray()
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to a closed MultipartUploadWriter')
+        self._buffer += data
+        self.size += len(data)
+        self.sha256.update(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _submit(self, data):
+        part_number = len(self._futures) + 1
+        if part_number > MAX_PARTS:
+            raise ValueError(f'More than {MAX_PARTS} parts, increase part_size.')
+        for future in self._futures:
+            # Fail fast instead of uploading the rest of the package.
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._upload_part, part_number, data))
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                PartNumber=part_number, Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    def code_sha256(self):
+        """
+        The hash of the uploaded bytes the way Lambda reports it in CodeSha256.
+        """
+        return base64.b64encode(self.sha256.digest()).decode()
+
+    def close(self):
+        """
+        Uploads the last part and completes the upload.
+        """
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._futures:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            parts = [future.result() for future in self._futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': parts})
+        except BaseException:
+            self.abort()
+            raise
+        self.closed = True
+        self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """
+        Abandons the upload, S3 drops the uploaded parts.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._executor.shutdown(wait=True)
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
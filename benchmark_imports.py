@@ -0,0 +1,87 @@
+# Measures how long importing every module of the repository takes with
+# `python -X importtime`, and fails when it goes over a budget, e.g.
+#
+#   python benchmark_imports.py --budget-ms 150
+#
+# Modules must import without side effects: no client, no API call.
+
+import argparse
+import os
+import pkgutil
+import subprocess
+import sys
+
+
+PACKAGES = ('EC2', 'IAM', 'Lambda', 'Cloudwatch', 'DynamoDb', 'Common')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover_modules(packages=PACKAGES):
+    """
+    Returns the names of the packages and of every module in them.
+    """
+    modules = []
+    for package in packages:
+        modules.append(package)
+        for module in pkgutil.iter_modules([os.path.join(ROOT, package)]):
+            modules.append(f'{package}.{module.name}')
+    return modules
+
+
+def measure(modules, python=sys.executable):
+    """
+    Imports the modules in a fresh interpreter.
+
+    :return: A list of (self us, cumulative us, depth, name) for every import.
+    """
+    # 'lambda' is a keyword, __import__ works for every module name.
+    code = '; '.join(f'__import__({name!r})' for name in modules)
+    result = subprocess.run([python, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f'Importing the modules failed with {result.returncode}.')
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measures the import time of the repository modules.')
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help='Maximum import time of all the modules, in ms.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to show.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the fastest one is kept.')
+    args = parser.parse_args(argv)
+
+    modules = discover_modules()
+    runs = []
+    for _ in range(args.repeat):
+        rows = measure(modules)
+        # Top level imports of our packages include whatever they import.
+        total = sum(cumulative for _, cumulative, depth, name in rows
+                    if depth == 0 and name.split('.')[0] in PACKAGES)
+        runs.append((total, rows))
+    total, rows = min(runs, key=lambda run: run[0])
+
+    print(f'{len(modules)} modules imported in {total / 1000:.1f} ms '
+          f'(budget {args.budget_ms:.0f} ms)')
+    print('Slowest imports (self time):')
+    for self_us, cumulative_us, _, name in sorted(rows, reverse=True)[:args.top]:
+        print(f'  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms cumulative  {name}')
+    if total / 1000 > args.budget_ms:
+        print('Over budget.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
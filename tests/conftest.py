@@ -0,0 +1,28 @@
+"""
+The tests run against moto, the AWS services are never called:
+
+    pip install boto3 moto pytest
+    python -m pytest tests
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Common import clients  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def aws(monkeypatch):
+    """
+    Fake credentials and region, and a client pool emptied around every test so
+    no client outlives the mock it was created in.
+    """
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    clients.clear()
+    yield
+    clients.clear()
@@ -0,0 +1,7 @@
+"""
+Lambda/lambda.py can't be imported with an import statement, lambda is a keyword.
+"""
+import importlib
+
+lambda_module = importlib.import_module('Lambda.lambda')
+LambdaAPI = lambda_module.LambdaAPI
@@ -0,0 +1,53 @@
+import pytest
+from moto import mock_aws
+from Cloudwatch.alarm import CloudWatch, alarm_differs
+
+CPU_ALARM = {
+    'AlarmName': 'app-cpu', 'MetricName': 'CPUUtilization', 'Namespace': 'AWS/EC2',
+    'Statistic': 'Average', 'Period': 300, 'EvaluationPeriods': 1, 'Threshold': 70,
+    'ComparisonOperator': 'GreaterThanOrEqualToThreshold',
+    'Dimensions': [{'Name': 'InstanceId', 'Value': 'i-1'}],
+}
+ERROR_RATE_ALARM = {
+    'AlarmName': 'app-error-rate', 'EvaluationPeriods': 1, 'Threshold': 5.0,
+    'ComparisonOperator': 'GreaterThanThreshold',
+    'Metrics': [
+        {'Id': 'rate', 'Expression': 'errors / invocations * 100', 'Label': 'Error rate'},
+        {'Id': 'invocations', 'ReturnData': False, 'MetricStat': {
+            'Metric': {'Namespace': 'AWS/Lambda', 'MetricName': 'Invocations',
+                       'Dimensions': [{'Name': 'FunctionName', 'Value': 'demo'}]},
+            'Period': 60, 'Stat': 'Sum'}},
+        {'Id': 'errors', 'ReturnData': False, 'MetricStat': {
+            'Metric': {'Namespace': 'AWS/Lambda', 'MetricName': 'Errors',
+                       'Dimensions': [{'Name': 'FunctionName', 'Value': 'demo'}]},
+            'Period': 60, 'Stat': 'Sum'}},
+    ],
+}
+
+
+@mock_aws
+def test_second_sync_changes_nothing():
+    cloudwatch = CloudWatch()
+    first = cloudwatch.sync_alarms([CPU_ALARM, ERROR_RATE_ALARM], prefix='app-')
+    assert sorted(first['create']) == ['app-cpu', 'app-error-rate']
+
+    second = cloudwatch.sync_alarms([CPU_ALARM, ERROR_RATE_ALARM], prefix='app-')
+    assert second['create'] == [] and second['update'] == []
+    assert sorted(second['unchanged']) == ['app-cpu', 'app-error-rate']
+
+
+@mock_aws
+def test_names_outside_the_prefix_are_rejected():
+    with pytest.raises(ValueError):
+        CloudWatch().sync_alarms([CPU_ALARM], prefix='other-')
+
+
+def test_metric_math_alarms_are_normalized():
+    # As describe_alarms returns it: default ReturnData, queries in another order.
+    existing = dict(ERROR_RATE_ALARM, Metrics=[
+        ERROR_RATE_ALARM['Metrics'][2], ERROR_RATE_ALARM['Metrics'][1],
+        dict(ERROR_RATE_ALARM['Metrics'][0], ReturnData=True),
+    ])
+    assert not alarm_differs(ERROR_RATE_ALARM, existing)
+    assert alarm_differs(dict(ERROR_RATE_ALARM, Metrics=ERROR_RATE_ALARM['Metrics'][:2]),
+                         existing)
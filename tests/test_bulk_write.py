@@ -0,0 +1,40 @@
+from decimal import Decimal
+import pytest
+from moto import mock_aws
+from Common.clients import get_client
+from DynamoDb.table_operations import Modeltable
+
+URL = 'https://dynamodb.us-east-1.amazonaws.com'
+
+
+def movies(count, bad=()):
+    for idx in range(count):
+        rating = 6.5 if idx in bad else Decimal('6.5')
+        yield {'year': 2000, 'title': f'movie {idx}', 'info': {'rating': rating}}
+
+
+@mock_aws
+def test_bad_record_fails_its_batch_only():
+    table = Modeltable('Movies', url=URL)
+    table.create_table('Movies')
+
+    # A float is rejected by the boto3 serializer with a TypeError.
+    stats = table.bulk_put_data(movies(100, bad=(30,)), workers=1)
+
+    assert stats['failed'] == 25 and stats['items'] == 75
+    assert get_client('dynamodb').scan(TableName='Movies', Select='COUNT')['Count'] == 75
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_producer_stops_once_every_writer_is_gone(monkeypatch):
+    table = Modeltable('Movies', url=URL)
+
+    def exit_thread(requests, max_retries):
+        raise SystemExit()
+    monkeypatch.setattr(table, '_write_batch', exit_thread)
+
+    batches = ([{'PutRequest': {'Item': {'year': 2000, 'title': str(idx)}}}]
+               for idx in range(20))
+    stats = table._bulk_write(batches, workers=2)
+
+    assert stats['items'] == 0 and stats['failed'] == 20
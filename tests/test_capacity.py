@@ -0,0 +1,42 @@
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from DynamoDb.capacity import MAX_PAGE_READ_UNITS, CapacityLimiter
+from DynamoDb.table_operations import Modeltable
+
+URL = 'https://dynamodb.us-east-1.amazonaws.com'
+
+
+def limited_table():
+    table = Modeltable('Movies', url=URL)
+    table.limiter = CapacityLimiter(1000, 1000)
+    return table
+
+
+def test_throttled_batch_is_retried_by_one_layer(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    table = limited_table()
+    requests = [{'PutRequest': {'Item': {'year': 2000, 'title': f'movie {idx}'}}}
+                for idx in range(3)]
+    with Stubber(table.ddb_client) as stubber:
+        for _ in range(8):
+            stubber.add_client_error('batch_write_item',
+                                     service_error_code='ProvisionedThroughputExceededException')
+        with pytest.raises(ClientError):
+            table._write_batch(requests, max_retries=8)
+        # 8 attempts in total, not 8 per layer.
+        stubber.assert_no_pending_responses()
+    assert table.limiter.counters['throttled'] == 8
+
+
+def test_pages_are_charged_what_they_consumed():
+    table = limited_table()
+    assert table.limiter.page_estimate('scan') == MAX_PAGE_READ_UNITS
+    with Stubber(table.ddb_client) as stubber:
+        stubber.add_response('scan', {'Items': [], 'ConsumedCapacity': {
+            'TableName': 'Movies', 'CapacityUnits': 10.0}}, {
+            'TableName': 'Movies', 'TotalSegments': 1, 'Segment': 0,
+            'ReturnConsumedCapacity': 'TOTAL'})
+        assert list(table.parallel_scan(workers=1)) == []
+    assert table.limiter.page_estimate('scan') == 10.0
+    assert table.limiter.counters['read_units'] == 10.0
@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+from Common.clients import get_client
+from DynamoDb.table_operations import Modeltable
+
+
+def test_clients_are_shared_across_threads():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(get_client, 'dynamodb').result()
+    assert other is get_client('dynamodb')
+
+
+def test_table_resource_is_per_thread():
+    table = Modeltable('Movies', url=True)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(lambda: (table.table, table.client)).result()
+    assert other[0] is not table.table and other[1] is not table.client
+    assert table.table is table.table and table.table.name == 'Movies'
+    # Every thread calls through the same thread safe client.
+    assert table.ddb_client is table.client.meta.client
@@ -0,0 +1,96 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from botocore.stub import Stubber
+from moto import mock_aws
+from Common.clients import get_client
+from EC2.instance import EC2Instance
+
+IMAGE_ID = 'ami-12c6146b'
+MISSING_ID = 'i-0123456789abcdef0'
+
+
+@mock_aws
+def test_bad_instance_ids_are_isolated():
+    client = get_client('ec2')
+    response = client.run_instances(ImageId=IMAGE_ID, MinCount=4, MaxCount=4)
+    instance_ids = [instance['InstanceId'] for instance in response['Instances']]
+
+    report = EC2Instance(client).stop_instances(instance_ids + [MISSING_ID], poll_interval=0)
+
+    assert report['succeeded'] == 4 and report['failed'] == 1
+    assert report['instances'][MISSING_ID]['error'].startswith('InvalidInstanceID')
+    for instance_id in instance_ids:
+        assert report['instances'][instance_id]['state'] == 'stopped'
+
+
+def stubbed(*errors):
+    client = get_client('ec2', region_name='us-east-1')
+    stubber = Stubber(client)
+    for code in errors:
+        stubber.add_client_error('stop_instances', service_error_code=code)
+    return EC2Instance(client), stubber
+
+
+def test_throttled_call_is_retried_not_split(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    ec2, stubber = stubbed('RequestLimitExceeded')
+    stubber.add_response('stop_instances', {'StoppingInstances': [
+        {'InstanceId': instance_id, 'CurrentState': {'Code': 64, 'Name': 'stopping'}}
+        for instance_id in ('i-1', 'i-2', 'i-3', 'i-4')]})
+    with stubber:
+        report = ec2.stop_instances(['i-1', 'i-2', 'i-3', 'i-4'], wait=False)
+        stubber.assert_no_pending_responses()
+    assert report['failed'] == 0
+
+
+def test_unauthorized_call_is_recorded_once():
+    ec2, stubber = stubbed('UnauthorizedOperation')
+    with stubber:
+        report = ec2.stop_instances(['i-1', 'i-2', 'i-3', 'i-4'], wait=False)
+        stubber.assert_no_pending_responses()
+    assert report['failed'] == 4
+    assert {outcome['error'] for outcome in report['instances'].values()} == \
+        {'UnauthorizedOperation'}
+
+
+def test_stop_without_instances_is_an_error():
+    with pytest.raises(ValueError):
+        EC2Instance(get_client('ec2', region_name='us-east-1')).stop_instances()
+
+
+class FailingSubnetClient(object):
+    """
+    An EC2 client whose run_instances calls in one subnet lose the connection.
+    """
+
+    def __init__(self, client, subnet_id) -> None:
+        self.client = client
+        self.subnet_id = subnet_id
+        self.tokens = []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def run_instances(self, **kwargs):
+        self.tokens.append(kwargs['ClientToken'])
+        if kwargs.get('SubnetId') == self.subnet_id:
+            raise EndpointConnectionError(endpoint_url='https://ec2.us-east-1.amazonaws.com')
+        return self.client.run_instances(**kwargs)
+
+
+@mock_aws
+def test_launched_instances_survive_a_failed_batch():
+    ec2 = EC2Instance(get_client('ec2'))
+    subnet_ids = ec2.get_launch_subnets()[:2]
+    client = FailingSubnetClient(ec2.client, subnet_ids[1])
+
+    result = EC2Instance(client).launch_fleet(
+        4, image_id=IMAGE_ID, subnet_ids=subnet_ids, batch_size=1, workers=2,
+        client_token='fleet')
+
+    # The instances of the other subnet are returned with the failures.
+    assert result['launched'] == 2
+    assert len(result['instance_ids']) == 2
+    assert [call['error'] for call in result['failures']] == ['EndpointConnectionError'] * 2
+    assert len(set(client.tokens)) == len(client.tokens)
+    assert all(token.startswith('fleet-') for token in client.tokens)
@@ -0,0 +1,23 @@
+import json
+from moto import mock_aws
+from Common.clients import get_client
+from IAM.group import Group
+
+POLICY = json.dumps({
+    'Version': '2012-10-17',
+    'Statement': [{'Effect': 'Allow', 'Action': 'ec2:DescribeInstances', 'Resource': '*'}],
+})
+
+
+@mock_aws
+def test_attach_and_delete_inline_policy():
+    client = get_client('iam')
+    client.create_group(GroupName='DemoGroup')
+    group = Group()
+
+    group.attach_group_policy('DemoGroup', inline_policy_name='Describe',
+                              inline_policy_document=POLICY)
+    assert client.list_group_policies(GroupName='DemoGroup')['PolicyNames'] == ['Describe']
+
+    group.delete_group_policy('DemoGroup', 'Describe')
+    assert client.list_group_policies(GroupName='DemoGroup')['PolicyNames'] == []
@@ -0,0 +1,39 @@
+import json
+from botocore.stub import Stubber
+from moto import mock_aws
+from Common.clients import get_client
+from tests.lambda_api import LambdaAPI
+
+ASSUME_ROLE = json.dumps({'Version': '2012-10-17', 'Statement': [{
+    'Effect': 'Allow', 'Principal': {'Service': 'lambda.amazonaws.com'},
+    'Action': 'sts:AssumeRole'}]})
+
+
+def lambda_role():
+    return get_client('iam').create_role(
+        RoleName='demo-lambda', AssumeRolePolicyDocument=ASSUME_ROLE)['Role']['Arn']
+
+
+@mock_aws
+def test_s3_deploy_uploads_only_changed_packages(tmp_path):
+    source = tmp_path / 'handler.py'
+    source.write_text('def handler(event, context):\n    return 1\n')
+    s3 = get_client('s3')
+    s3.create_bucket(Bucket='packages')
+    api = LambdaAPI(get_client('lambda'))
+    kwargs = dict(bucket='packages', handler_name='handler.handler', iam_role=lambda_role())
+
+    first = api.deploy_package_s3('demo', str(source), s3_client=s3, **kwargs)
+    assert first['action'] == 'create'
+    assert s3.head_object(Bucket='packages', Key='demo.zip')['ContentLength'] > 0
+
+    # Unchanged sources: any S3 call would fail the stubbed client.
+    with Stubber(get_client('s3', region_name='eu-west-1')) as unused_s3:
+        second = api.deploy_package_s3('demo', str(source), s3_client=unused_s3.client, **kwargs)
+    assert second['action'] == 'skip'
+    assert second['code_sha256'] == first['code_sha256']
+
+    source.write_text('def handler(event, context):\n    return 2\n')
+    third = api.deploy_package_s3('demo', str(source), s3_client=s3, **kwargs)
+    assert third['action'] == 'update'
+    assert third['code_sha256'] != first['code_sha256']
@@ -0,0 +1,42 @@
+from botocore.stub import Stubber
+from Common.clients import get_client
+from Lambda.inventory import DetailsCache
+from tests.lambda_api import LambdaAPI
+
+ARN = 'arn:aws:lambda:us-east-1:123456789012:function:demo'
+CONFIGURATION = {'FunctionName': 'demo', 'FunctionArn': ARN, 'Version': '$LATEST',
+                 'RevisionId': 'rev-1'}
+
+
+def alias(name):
+    return {'Name': name, 'AliasArn': f'{ARN}:{name}', 'FunctionVersion': '1'}
+
+
+def list_functions(stubber, aliases, concurrency, fetch_configuration):
+    stubber.add_response('list_functions', {'Functions': [CONFIGURATION]},
+                         {'FunctionVersion': 'ALL'})
+    if fetch_configuration:
+        stubber.add_response('get_function_configuration', dict(CONFIGURATION, MemorySize=128),
+                             {'FunctionName': 'demo', 'Qualifier': '$LATEST'})
+    stubber.add_response('get_function_concurrency',
+                         {'ReservedConcurrentExecutions': concurrency}, {'FunctionName': 'demo'})
+    stubber.add_response('list_aliases', {'Aliases': aliases}, {'FunctionName': 'demo'})
+
+
+def test_only_the_configuration_is_cached(tmp_path):
+    api = LambdaAPI(get_client('lambda'))
+    cache_path = str(tmp_path / 'functions.json')
+    with Stubber(api.client) as stubber:
+        list_functions(stubber, [alias('live')], 5, fetch_configuration=True)
+        first, = api.iter_functions(details=True, workers=1, cache=DetailsCache(cache_path))
+
+        # Same RevisionId: the configuration comes from the cache, the aliases and
+        # the concurrency which changed meanwhile don't.
+        list_functions(stubber, [alias('live'), alias('canary')], 10, fetch_configuration=False)
+        second, = api.iter_functions(details=True, workers=1, cache=DetailsCache(cache_path))
+        stubber.assert_no_pending_responses()
+
+    assert first['Details']['Configuration']['MemorySize'] == 128
+    assert second['Details']['Configuration']['MemorySize'] == 128
+    assert [a['Name'] for a in second['Details']['Aliases']] == ['live', 'canary']
+    assert second['Details']['ReservedConcurrentExecutions'] == 10
@@ -0,0 +1,52 @@
+import io
+from botocore.exceptions import ReadTimeoutError
+from botocore.stub import Stubber
+from Common.clients import get_client
+from tests.lambda_api import LambdaAPI
+
+
+def test_backoff_is_not_latency(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('time.monotonic', lambda: clock[0])
+
+    def sleep(seconds):
+        clock[0] += 5.0
+    monkeypatch.setattr('time.sleep', sleep)
+
+    api = LambdaAPI(get_client('lambda'))
+    with Stubber(api.client) as stubber:
+        stubber.add_client_error('invoke', service_error_code='TooManyRequestsException')
+        stubber.add_response('invoke', {'StatusCode': 200, 'Payload': io.BytesIO(b'{}')})
+        report = api.invoke_many('demo', [{}], workers=1)
+
+    assert report['succeeded'] == 1 and report['retries'] == 1
+    # The 5s of backoff are reported as retry time, not as invocation latency.
+    assert report['latency']['max'] == 0.0
+    assert report['retry_seconds'] == 5.0
+
+
+class TimingOutClient(object):
+    """
+    A Lambda client whose third invocation times out.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.calls = 0
+
+    def invoke(self, **kwargs):
+        self.calls += 1
+        if self.calls == 3:
+            raise ReadTimeoutError(endpoint_url='https://lambda.us-east-1.amazonaws.com')
+        return {'StatusCode': 200, 'Payload': io.BytesIO(b'{"ok": true}')}
+
+
+def test_timeout_fails_one_payload_only():
+    api = LambdaAPI(get_client('lambda'))
+    api.client = TimingOutClient(api.client)
+
+    report = api.invoke_many('demo', [{}] * 5, workers=1, keep_results=True)
+
+    assert report['invocations'] == 5
+    assert report['succeeded'] == 4 and report['failed'] == 1
+    assert report['results'][2]['error'] == 'ReadTimeoutError'
@@ -0,0 +1,79 @@
+import json
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from Common.clients import get_client
+from tests.lambda_api import LambdaAPI
+from tests.test_lambda_deploy import lambda_role
+
+STALE_RULE_ARN = 'arn:aws:events:us-east-1:123456789012:rule/deleted-rule'
+
+
+class ConflictingLambdaClient(object):
+    """
+    A Lambda client refusing a StatementId already in the policy, as Lambda
+    does and moto doesn't.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def add_permission(self, **kwargs):
+        try:
+            response = self.client.get_policy(FunctionName=kwargs['FunctionName'])
+            policy = json.loads(response['Policy'])
+        except ClientError:
+            policy = {'Statement': []}
+        if any(statement['Sid'] == kwargs['StatementId'] for statement in policy['Statement']):
+            raise ClientError({'Error': {'Code': 'ResourceConflictException'}}, 'AddPermission')
+        return self.client.add_permission(**kwargs)
+
+
+def create_function(tmp_path, client, name):
+    source = tmp_path / 'handler.py'
+    source.write_text('def handler(event, context):\n    return 1\n')
+    client.create_function(
+        FunctionName=name, Runtime='python3.9', Role=lambda_role(), Handler='handler.handler',
+        Code={'ZipFile': LambdaAPI(client).create_zip_package(str(source))})
+
+
+def rule_sources(client, name):
+    policy = json.loads(client.get_policy(FunctionName=name)['Policy'])
+    return {statement['Sid']: statement['Condition']['ArnLike']['AWS:SourceArn']
+            for statement in policy['Statement']}
+
+
+@mock_aws
+def test_schedule_only_creates_what_is_missing(tmp_path):
+    client = get_client('lambda')
+    create_function(tmp_path, client, 'demo')
+    api = LambdaAPI(ConflictingLambdaClient(client))
+    specs = [('nightly', 'rate(1 day)', 'demo'), ('hourly', 'rate(1 hour)', 'demo')]
+
+    first = api.schedule_lambda_functions(specs, workers=2, permissions_per_second=100)
+    assert first['errors'] == []
+    assert sorted(first['rules']) == ['hourly', 'nightly']
+    assert len(first['permissions']) == 2 and len(first['targets']) == 2
+
+    second = api.schedule_lambda_functions(specs, workers=2, permissions_per_second=100)
+    assert second['calls'] == 0 and second['errors'] == []
+
+
+@mock_aws
+def test_stale_statement_is_replaced(tmp_path):
+    client = get_client('lambda')
+    create_function(tmp_path, client, 'demo')
+    # Left by a rule of the same name which was deleted.
+    client.add_permission(FunctionName='demo', StatementId='nightly-invoke',
+                          Action='lambda:InvokeFunction', Principal='events.amazonaws.com',
+                          SourceArn=STALE_RULE_ARN)
+    api = LambdaAPI(ConflictingLambdaClient(client))
+
+    report = api.schedule_lambda_functions([('nightly', 'rate(1 day)', 'demo')],
+                                           permissions_per_second=100)
+
+    rule_arn = get_client('events').describe_rule(Name='nightly')['Arn']
+    assert report['errors'] == []
+    assert rule_sources(client, 'demo') == {'nightly-invoke': rule_arn}
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+import boto3
+from botocore.stub import Stubber
+from moto import mock_aws
+from Cloudwatch.logs import LogFetcher, log_group_ingestion_report, metric_period
+from Common.clients import get_client
+
+NOW = dt(2026, 1, 1)
+
+
+def period(days_ago, window, queries=1):
+    start = NOW - timedelta(days=days_ago)
+    return metric_period(start, start + window, queries, now=NOW)
+
+
+def test_period_follows_the_retention_of_the_start_date():
+    assert period(1, timedelta(seconds=90)) == 120
+    assert period(20, timedelta(seconds=90)) == 300
+    assert period(20, timedelta(days=1, seconds=1)) % 300 == 0
+    assert period(70, timedelta(minutes=10)) == 3600
+    assert period(70, timedelta(days=1, seconds=1)) % 3600 == 0
+
+
+def test_period_covers_the_window():
+    assert period(7, timedelta(days=7), queries=500) == 7 * 24 * 3600
+
+
+@mock_aws
+def test_tail_starts_at_the_requested_start():
+    client = boto3.client('logs')
+    client.create_log_group(logGroupName='app')
+    client.create_log_stream(logGroupName='app', logStreamName='web')
+    start = int(time.time() * 1000) - 60 * 1000
+    client.put_log_events(logGroupName='app', logStreamName='web', logEvents=[
+        {'timestamp': start - 10 * 1000, 'message': 'before'},
+        {'timestamp': start + 10 * 1000, 'message': 'after'},
+    ])
+    tail = LogFetcher(client).tail('app', start=start, lag_seconds=30.0)
+    assert next(tail)['message'] == 'after'
+
+
+def test_throttled_metric_batch_is_retried(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    logs = get_client('logs')
+    cloudwatch = get_client('cloudwatch')
+    with Stubber(logs) as logs_stubber, Stubber(cloudwatch) as stubber:
+        logs_stubber.add_response('describe_log_groups', {'logGroups': [
+            {'logGroupName': 'app'}, {'logGroupName': 'quiet'}]})
+        stubber.add_client_error('get_metric_data', service_error_code='Throttling')
+        stubber.add_client_error('get_metric_data', service_error_code='LimitExceeded')
+        stubber.add_response('get_metric_data', {'MetricDataResults': [
+            {'Id': 'q0', 'Values': [3e9]}, {'Id': 'q1', 'Values': []}]})
+        report = log_group_ingestion_report(logs, cloudwatch, end_date=NOW)
+        stubber.assert_no_pending_responses()
+
+    assert report == [('app', 3e9)]
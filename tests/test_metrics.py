@@ -0,0 +1,27 @@
+import io
+import json
+from Cloudwatch.metrics import MetricPublisher
+
+
+def emf_values(puts):
+    stream = io.StringIO()
+    with MetricPublisher(namespace='Test', sink='emf', stream=stream, flush_interval=60) as metrics:
+        for args in puts:
+            metrics.put(*args)
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_counters_are_written_as_their_sum():
+    documents = emf_values([('Processed', 1, 'Count')] * 5000 +
+                           [('Processed', 2.5, 'Count', None, 2.0)])
+    assert len(documents) == 1
+    assert documents[0]['Processed'] == [5005.0]
+
+
+def test_other_values_keep_their_counts():
+    documents = emf_values([('Latency', 10, 'Milliseconds')] * 10000 +
+                           [('Latency', 20, 'Milliseconds')])
+    assert len(documents) == 1
+    assert documents[0]['Latency'] == {
+        'Values': [10.0, 20.0], 'Counts': [10000.0, 1.0],
+        'Max': 20.0, 'Min': 10.0, 'Count': 10001.0, 'Sum': 100020.0}
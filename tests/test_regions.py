@@ -0,0 +1,40 @@
+from moto import mock_aws
+from Common.clients import get_client
+from Common.regions import RegionExecutor
+from DynamoDb.table_operations import Modeltable
+
+REGIONS = ['us-east-1', 'eu-west-1']
+
+
+def create_tables():
+    for region in REGIONS:
+        client = get_client('dynamodb', region_name=region)
+        client.create_table(
+            TableName='Orders',
+            KeySchema=[{'AttributeName': 'order_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'order_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+        client.put_item(TableName='Orders', Item={'order_id': {'S': region}})
+
+
+def order_ids(results):
+    return {region: [item['order_id'] for item in items] for region, items in results}
+
+
+@mock_aws
+def test_table_fan_out_keeps_the_endpoint_of_the_table():
+    create_tables()
+    table = Modeltable('Orders', url=True)
+    with RegionExecutor(max_workers=2) as executor:
+        results = executor.run(table, 'parallel_scan', kwargs={'workers': 1},
+                               regions=REGIONS)
+        assert order_ids(results) == {region: [region] for region in REGIONS}
+
+
+@mock_aws
+def test_table_class_fan_out_uses_the_regional_endpoints():
+    create_tables()
+    with RegionExecutor(max_workers=2) as executor:
+        results = executor.run(Modeltable, 'parallel_scan', kwargs={'workers': 1},
+                               regions=REGIONS, init_args=('Orders',))
+        assert order_ids(results) == {region: [region] for region in REGIONS}
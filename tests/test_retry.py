@@ -0,0 +1,71 @@
+import pytest
+from botocore.exceptions import ClientError
+from Common.retry import CircuitBreaker, Incomplete, Retrier
+
+
+def throttled():
+    return ClientError({'Error': {'Code': 'ThrottlingException'}}, 'Operation')
+
+
+def test_decorator_keeps_the_function_metadata():
+    @Retrier()
+    def describe(name):
+        """Describes something."""
+        return name
+
+    assert describe.__name__ == 'describe'
+    assert describe.__doc__ == 'Describes something.'
+    assert describe.__wrapped__('x') == 'x'
+
+
+def test_incomplete_work_is_retried(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    remaining = [3, 2, 1, 0]
+
+    def process():
+        left = remaining.pop(0)
+        if left:
+            raise Incomplete(left)
+        return 'done'
+
+    retrier = Retrier((Incomplete.code,), max_attempts=5)
+    assert retrier.call(process) == 'done'
+    assert retrier.stats()['retries_by_code'] == {'Incomplete': 3}
+
+
+def test_classify_decides_what_is_retried(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise throttled()
+
+    retrier = Retrier(max_attempts=3, classify=lambda error: None)
+    try:
+        retrier.call(fail)
+    except ClientError:
+        pass
+    assert len(calls) == 1
+
+
+def test_only_retryable_errors_open_the_circuit(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    breaker = CircuitBreaker(failure_threshold=3)
+    retrier = Retrier(max_attempts=1, breaker=breaker)
+
+    def check_failed():
+        raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+
+    for _ in range(10):
+        with pytest.raises(ClientError):
+            retrier.call(check_failed)
+    assert breaker.state == 'closed'
+
+    def throttle():
+        raise throttled()
+
+    for _ in range(3):
+        with pytest.raises(ClientError):
+            retrier.call(throttle)
+    assert breaker.state == 'open'
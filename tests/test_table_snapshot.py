@@ -0,0 +1,64 @@
+from decimal import Decimal
+from boto3.dynamodb.types import Binary
+from moto import mock_aws
+from Common.clients import get_client
+from DynamoDb.snapshot import Snapshot, SnapshotWriter
+from DynamoDb.table_operations import Modeltable
+
+URL = 'https://dynamodb.us-east-1.amazonaws.com'
+
+
+def create_orders_table(name):
+    get_client('dynamodb').create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'order_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'order_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+
+
+@mock_aws
+def test_restore_uses_the_keys_of_the_snapshot(tmp_path):
+    create_orders_table('Orders')
+    create_orders_table('OrdersCopy')
+    source = Modeltable('Orders', url=URL)
+    for idx in range(60):
+        source.table.put_item(Item={'order_id': f'order-{idx}', 'total': idx})
+    filepath = str(tmp_path / 'orders.snap')
+    assert source.snapshot(filepath, workers=2) == 60
+
+    stats = Modeltable('OrdersCopy', url=URL).restore(filepath, workers=2)
+
+    assert stats['items'] == 60 and stats['failed'] == 0
+    assert get_client('dynamodb').scan(TableName='OrdersCopy', Select='COUNT')['Count'] == 60
+
+
+def test_snapshot_round_trip_through_spilled_index_runs(tmp_path):
+    filepath = str(tmp_path / 'movies.snap')
+    items = [{'year': 2000 + idx % 7, 'title': f'movie {idx}',
+              'info': {'rating': Decimal('6.5'), 'genres': ['Drama', None, True],
+                       'tags': {'a', 'b'}, 'poster': Binary(b'\x00\xff')}}
+             for idx in range(50)]
+    with SnapshotWriter(filepath, ['year', 'title'], index_run_size=8) as writer:
+        for item in items:
+            writer.write(item)
+
+    with Snapshot(filepath) as snapshot:
+        assert len(snapshot) == 50
+        assert list(snapshot) == items
+        for item in items:
+            assert snapshot.get(item) == item
+        assert snapshot.get({'year': 1999, 'title': 'movie 0'}) is None
+
+
+@mock_aws
+def test_restore_counts_a_bad_record_as_failed(tmp_path):
+    create_orders_table('Orders')
+    filepath = str(tmp_path / 'orders.snap')
+    with SnapshotWriter(filepath, ['order_id']) as writer:
+        writer.write({'order_id': 'order-1', 'total': 1})
+        # The table's key is a string, DynamoDB rejects the number.
+        writer.write({'order_id': 2, 'total': 2})
+
+    stats = Modeltable('Orders', url=URL).restore(filepath, workers=2)
+
+    assert stats['failed'] > 0
@@ -0,0 +1,72 @@
+import pytest
+from botocore.stub import ANY, Stubber
+from DynamoDb.table_operations import Modeltable
+from DynamoDb.update_buffer import UpdateBuffer, merge_fields
+
+
+def cancelled(stubber, *codes):
+    stubber.add_client_error(
+        'transact_write_items', service_error_code='TransactionCanceledException',
+        modeled_fields={'CancellationReasons': [{'Code': code} for code in codes]},
+        expected_params={'TransactItems': ANY})
+
+
+def write(*codes):
+    table = Modeltable('Movies', url='https://dynamodb.us-east-1.amazonaws.com')
+    buffer = UpdateBuffer(table, max_delay=60.0, max_retries=2)
+    with Stubber(table.ddb_client) as stubber:
+        for reasons in codes:
+            cancelled(stubber, *reasons)
+        stubber.add_response('transact_write_items', {}, {'TransactItems': ANY})
+        buffer.update(2021, 'Venom', {'info.rating': 6})
+        buffer.update(2021, 'Dune', {'info.rating': 8})
+        buffer.close()
+    return buffer.stats(), stubber
+
+
+def test_conflicting_transaction_is_retried():
+    stats, stubber = write(['TransactionConflict', 'None'], ['None', 'ThrottlingError'])
+    stubber.assert_no_pending_responses()
+    assert stats['written'] == 2 and stats['failed'] == 0
+
+
+def test_failed_condition_is_not_retried():
+    stats, stubber = write(['ConditionalCheckFailed', 'TransactionConflict'])
+    assert stats['written'] == 0 and stats['failed'] == 2
+    # The success response queued for a retry was never used.
+    assert len(stubber._queue) == 1
+
+
+def test_overlapping_paths_are_merged():
+    assert merge_fields({'info.rating': 6, 'info.plot': 'x'}, {'info': {'rating': 7}}) == \
+        {'info': {'rating': 7}}
+    assert merge_fields({'info': {'rating': 6}}, {'info.genres.main': 'Drama'}) == \
+        {'info': {'rating': 6, 'genres': {'main': 'Drama'}}}
+    assert merge_fields({'info.rating': 6}, {'info.rank': 2}) == {'info.rating': 6, 'info.rank': 2}
+    with pytest.raises(ValueError):
+        merge_fields({'actors': ['a']}, {'actors[0]': 'b'})
+
+
+def test_coalesced_update_has_no_overlapping_paths():
+    table = Modeltable('Movies', url='https://dynamodb.us-east-1.amazonaws.com')
+    buffer = UpdateBuffer(table, max_delay=60.0)
+    buffer.update(2021, 'Venom', {'info.rating': 6})
+    buffer.update(2021, 'Venom', {'info': {'rating': 7, 'rank': 1}})
+    with Stubber(table.ddb_client) as stubber:
+        stubber.add_response('transact_write_items', {}, {'TransactItems': [{'Update': {
+            'TableName': 'Movies', 'Key': {'year': 2021, 'title': 'Venom'},
+            'UpdateExpression': 'SET info=:p0',
+            'ExpressionAttributeValues': {':p0': {'rating': 7, 'rank': 1}}}}]})
+        buffer.close()
+        stubber.assert_no_pending_responses()
+    assert buffer.stats()['written'] == 1
+
+
+def test_unexpected_error_counts_the_updates_as_failed():
+    table = Modeltable('Movies', url='https://dynamodb.us-east-1.amazonaws.com')
+    buffer = UpdateBuffer(table, max_delay=60.0)
+    # Floats are rejected by the boto3 serializer with a TypeError.
+    buffer.update(2021, 'Venom', {'info.rating': 6.5})
+    buffer.update(2021, 'Dune', {'info.rating': 8})
+    buffer.close()
+    assert buffer.stats()['failed'] == 2